@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmark du chemin d'ingestion de mqttToCsv.py:
+on_message -> file d'ingestion -> process_batch -> write_aggregation_to_csv.
+
+Génère des messages Tasmota SML réalistes (fragments par seconde, en rafales,
+et résumés TS toutes les 5 minutes) et les fait passer par mqttToCsv, soit
+directement dans le processus (--mode inprocess), soit via un broker MQTT
+minimal local lancé dans un processus séparé (--mode broker). Affiche le
+débit en messages/s, la latence du callback (p50/p99), le temps CPU et la
+mémoire maximale (RSS).
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import resource
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from energie_schema import FIELDS
+
+START_TIME = datetime(2026, 1, 14, 0, 0, 0)
+
+# Valeurs de départ et amplitude de la marche aléatoire de chaque champ
+FIELD_BASE = {
+    "Pi": (1.2, 0.2), "Po": (0.4, 0.2),
+    "B1": (10017.763, 0.0), "B2": (11931.218, 0.0), "E1": (15397.878, 0.0), "E2": (34.25, 0.0),
+    "P1i": (0.5, 0.1), "P2i": (0.4, 0.1), "P3i": (0.3, 0.1),
+    "P1o": (0.1, 0.1), "P2o": (0.1, 0.1), "P3o": (0.1, 0.1),
+    "I1": (4.0, 0.5), "I2": (3.0, 0.5), "I3": (2.0, 0.5),
+    "U1": (231.0, 0.5), "U2": (232.0, 0.5), "U3": (230.0, 0.5),
+}
+COUNTERS = ("B1", "B2", "E1", "E2")
+
+
+def device_topic(index):
+    """Sujet MQTT du compteur simulé `index` (le premier est le compteur principal)."""
+    return "tele/tasmota_EB7D9F/SENSOR" if index == 0 else f"tele/bench_{index}/SENSOR"
+
+
+def generate_payloads(count, fragments=10.0, ts_interval=300, devices=1, seed=0):
+    """Génère `count` messages (topic, payload) de compteurs Tasmota simulés.
+
+    Chaque seconde simulée, chaque compteur envoie un nombre de fragments
+    tiré d'une loi exponentielle de moyenne `fragments` (rafales), avec un
+    seul champ par fragment, et un résumé TS complet toutes les
+    `ts_interval` secondes.
+    """
+    rng = random.Random(seed)
+    states = [{name: FIELD_BASE[name][0] for name in FIELDS} for _ in range(devices)]
+    topics = [device_topic(i) for i in range(devices)]
+    emitted = 0
+    second = 0
+    while True:
+        time_str = (START_TIME + timedelta(seconds=second)).strftime("%Y-%m-%dT%H:%M:%S")
+        for topic, state in zip(topics, states):
+            for name in COUNTERS:
+                state[name] += rng.random() * 0.0005
+            if second % ts_interval == 0:
+                z_data = {"TS": f"{time_str[2:4]}{time_str[5:7]}{time_str[8:10]}"
+                                f"{time_str[11:13]}{time_str[14:16]}{time_str[17:19]}W",
+                          "NS": 353234363435}
+                z_data.update({name: round(value, 3) for name, value in state.items()})
+                yield topic, json.dumps({"Time": time_str, "z": z_data}).encode()
+                emitted += 1
+                if emitted >= count:
+                    return
+            for _ in range(max(1, int(rng.expovariate(1.0 / fragments)))):
+                name = rng.choice(FIELDS)
+                step = FIELD_BASE[name][1]
+                if step:
+                    state[name] = max(0.0, state[name] + rng.uniform(-step, step))
+                payload = {"Time": time_str, "z": {name: round(state[name], 3)}}
+                yield topic, json.dumps(payload).encode()
+                emitted += 1
+                if emitted >= count:
+                    return
+        second += 1
+
+
+def paced(messages, rate):
+    """Limite le débit de l'itérable `messages` à `rate` messages/s (0 = sans limite)."""
+    if not rate:
+        yield from messages
+        return
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        if i % 100 == 0:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield message
+
+
+class Message:
+    """Équivalent minimal de paho.mqtt.client.MQTTMessage pour le mode inprocess."""
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+# --- Broker MQTT minimal (MQTT 3.1.1, QoS 0, un seul client) ---
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _read_packet(conn):
+    header = conn.recv(1)
+    if not header:
+        return None, b""
+    multiplier, length = 1, 0
+    while True:
+        byte = conn.recv(1)[0]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte & 0x80:
+            break
+    body = b""
+    while len(body) < length:
+        chunk = conn.recv(length - len(body))
+        if not chunk:
+            return None, b""
+        body += chunk
+    return header[0] >> 4, body
+
+
+def run_broker(port_queue, count, rate, fragments, devices, seed):
+    """Accepte un client, répond à CONNECT/SUBSCRIBE puis publie les messages générés."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    port_queue.put(server.getsockname()[1])
+    conn, _ = server.accept()
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    subscribed = False
+    while not subscribed:
+        packet_type, body = _read_packet(conn)
+        if packet_type is None:
+            return
+        if packet_type == 1:    # CONNECT
+            conn.sendall(b"\x20\x02\x00\x00")
+        elif packet_type == 8:  # SUBSCRIBE
+            packet_id = body[:2]
+            topics = 0
+            offset = 2
+            while offset < len(body):
+                (topic_len,) = struct.unpack_from("!H", body, offset)
+                offset += 2 + topic_len + 1
+                topics += 1
+            conn.sendall(b"\x90" + _encode_length(2 + topics) + packet_id + b"\x00" * topics)
+            subscribed = True
+        elif packet_type == 12:  # PINGREQ
+            conn.sendall(b"\xd0\x00")
+
+    messages = paced(generate_payloads(count, fragments, devices=devices, seed=seed), rate)
+    batch = bytearray()
+    for topic, payload in messages:
+        topic_bytes = topic.encode()
+        body = struct.pack("!H", len(topic_bytes)) + topic_bytes + payload
+        batch += b"\x30" + _encode_length(len(body)) + body
+        if len(batch) > 16384 or rate:
+            conn.sendall(batch)
+            batch.clear()
+    if batch:
+        conn.sendall(batch)
+    # Répondre aux PINGREQ jusqu'à la déconnexion du client
+    conn.settimeout(60)
+    try:
+        while True:
+            packet_type, _ = _read_packet(conn)
+            if packet_type is None or packet_type == 14:  # DISCONNECT
+                break
+            if packet_type == 12:
+                conn.sendall(b"\xd0\x00")
+    except OSError:
+        pass
+    conn.close()
+    server.close()
+
+
+# --- Mesures ---
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Recorder:
+    """Chronomètre le callback on_message et les écritures périodiques."""
+
+    def __init__(self, mqtt_module):
+        self.m = mqtt_module
+        self.latencies = array('d')
+        self.flushes = array('d')
+        self.received = 0
+        self.done = threading.Event()
+        self.expected = 0
+        self.stop = threading.Event()
+
+    def on_message(self, client, userdata, msg):
+        start = time.perf_counter()
+        self.m.on_message(client, userdata, msg)
+        self.latencies.append(time.perf_counter() - start)
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+    def writer(self, period):
+        """Équivalent de periodic_write avec une période courte."""
+        while not self.stop.wait(period):
+            self.flush()
+
+    def flush(self, final=False):
+        start = time.perf_counter()
+        for device in list(self.m.devices.values()):
+            self.m.write_aggregation_to_csv(device, final)
+        self.m.flush_writers()
+        self.flushes.append(time.perf_counter() - start)
+
+
+def bench_inprocess(m, recorder, args):
+    messages = [Message(topic, payload) for topic, payload in
+                generate_payloads(args.messages, args.fragments, devices=args.devices, seed=args.seed)]
+    start = time.perf_counter()
+    for msg in paced(messages, args.rate):
+        recorder.on_message(None, None, msg)
+    return start
+
+
+def bench_broker(m, recorder, args):
+    import paho.mqtt.client as mqtt
+    port_queue = multiprocessing.Queue()
+    broker = multiprocessing.Process(
+        target=run_broker,
+        args=(port_queue, args.messages, args.rate, args.fragments, args.devices, args.seed),
+        daemon=True)
+    broker.start()
+    port = port_queue.get(timeout=10)
+
+    m.MQTT_TOPICS = ["tele/+/SENSOR"]
+    client = mqtt.Client(client_id="bench_ingest", clean_session=True,
+                         callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = m.on_connect
+    client.on_message = recorder.on_message
+    client.connect("127.0.0.1", port, 60)
+    start = time.perf_counter()
+    client.loop_start()
+    finished = recorder.done.wait(args.timeout)
+    client.disconnect()
+    client.loop_stop()
+    broker.join(5)
+    if not finished:
+        print(f"⚠️  Délai dépassé: {recorder.received}/{args.messages} messages reçus")
+    return start
+
+
+def run(mode, args):
+    import mqttToCsv as m
+    data_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    m.DATA_DIR = data_dir
+    m.SPOOL = not args.no_spool
+    m.BINARY = not args.no_binary
+    m.FSYNC = not args.no_fsync
+    m.QUEUE_SIZE = args.queue_size
+    m.QUEUE_POLICY = args.queue_policy
+    m.devices.clear()
+    m.topic_devices.clear()
+
+    recorder = Recorder(m)
+    recorder.expected = args.messages
+    writer = threading.Thread(target=recorder.writer, args=(args.flush_period,), daemon=True)
+    writer.start()
+
+    cpu_start = time.process_time()
+    ingest_thread = m.start_ingest()
+    try:
+        if mode == "inprocess":
+            start = bench_inprocess(m, recorder, args)
+        else:
+            start = bench_broker(m, recorder, args)
+        # Le débit inclut le traitement des messages restés dans la file
+        m.stop_ingest(ingest_thread)
+        elapsed = time.perf_counter() - start
+        recorder.stop.set()
+        writer.join()
+        recorder.flush(final=True)
+        cpu = time.process_time() - cpu_start
+        m.close_writers()
+        for device in m.devices.values():
+            device.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        "mode": mode,
+        "messages": recorder.received,
+        "seconds": elapsed,
+        "msgs_per_s": recorder.received / elapsed if elapsed else 0.0,
+        "p50_us": percentile(recorder.latencies, 0.50) * 1e6,
+        "p99_us": percentile(recorder.latencies, 0.99) * 1e6,
+        "flush_p50_ms": percentile(recorder.flushes, 0.50) * 1e3,
+        "flush_max_ms": max(recorder.flushes, default=0.0) * 1e3,
+        "cpu_s": cpu,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'ingestion MQTT de mqttToCsv")
+    parser.add_argument('--mode', choices=['inprocess', 'broker', 'both'], default='both',
+                       help='Chemin mesuré (défaut: both)')
+    parser.add_argument('--messages', type=int, default=100000,
+                       help='Nombre de messages générés (défaut: 100000)')
+    parser.add_argument('--rate', type=float, default=0,
+                       help='Débit cible en messages/s, 0 = le plus vite possible (défaut: 0)')
+    parser.add_argument('--fragments', type=float, default=10.0,
+                       help='Nombre moyen de fragments par seconde et par compteur (défaut: 10)')
+    parser.add_argument('--devices', type=int, default=1,
+                       help='Nombre de compteurs simulés (défaut: 1)')
+    parser.add_argument('--flush-period', type=float, default=5.0,
+                       help='Période des écritures agrégées en secondes (défaut: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Graine du générateur')
+    parser.add_argument('--timeout', type=float, default=300, help='Délai maximal du mode broker')
+    parser.add_argument('--queue-size', type=int, default=10000, help='Taille de la file d\'ingestion')
+    parser.add_argument('--queue-policy', choices=['block', 'drop-oldest', 'spill'], default='block',
+                       help='Politique de la file pleine (défaut: block)')
+    parser.add_argument('--no-spool', action='store_true', help='Désactive le spool')
+    parser.add_argument('--no-binary', action='store_true', help='Désactive le fichier binaire')
+    parser.add_argument('--no-fsync', action='store_true', help='Désactive les fsync')
+    parser.add_argument('--json', action='store_true', help='Affiche les résultats en JSON')
+    args = parser.parse_args()
+
+    modes = ['inprocess', 'broker'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        result = run(mode, args)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"📊 {mode}: {result['messages']} messages en {result['seconds']:.2f} s")
+        print(f"   Débit: {result['msgs_per_s']:.0f} msgs/s")
+        print(f"   Latence callback: p50 {result['p50_us']:.1f} µs, p99 {result['p99_us']:.1f} µs")
+        print(f"   Écritures: p50 {result['flush_p50_ms']:.2f} ms, max {result['flush_max_ms']:.2f} ms")
+        print(f"   CPU: {result['cpu_s']:.2f} s, RSS max: {result['peak_rss_kb'] / 1024:.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Compaction des jours terminés: convertit les fichiers CSV jour
+(ts_summary, energie, rollup, solaredge) en fichiers Parquet compressés.
+
+Le fichier Parquet est écrit à côté du CSV (même nom, extension .parquet),
+avec des types explicites et des statistiques par groupe de lignes, puis
+relu et comparé au CSV avant d'être conservé. Les dashboards lisent le
+Parquet en priorité s'il existe.
+"""
+
+import argparse
+import os
+import re
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+DATA_DIR = "data/"
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 3600  # une heure de données par seconde par groupe de lignes
+
+# Fichiers jour compactables: <type>_AAAAMMJJ.csv
+DAY_FILE_RE = re.compile(r"^(ts_summary|energie|rollup_(?:10s|1min|15min|1h)|solaredge_power|solaredge_daily)_(\d{8})\.csv$")
+
+# Colonnes non numériques
+TIME_COLUMNS = ("Time", "Date")
+TEXT_COLUMNS = ("TS",)
+INTEGER_COLUMNS = ("NS", "count", "Nombre_Points")
+
+
+def closed_day_files(data_dir, today=None):
+    """Retourne les fichiers CSV des jours terminés, triés par nom.
+
+    La veille n'est pas compactée: mqttToCsv garde ses fichiers ouverts
+    ROTATION_GRACE secondes après minuit et le spool peut encore y rejouer
+    des secondes au redémarrage.
+    """
+    today = datetime.strptime(today, "%Y%m%d") if today else datetime.now()
+    last_closed = (today - timedelta(days=1)).strftime("%Y%m%d")
+    files = []
+    for name in sorted(os.listdir(data_dir)):
+        match = DAY_FILE_RE.match(name)
+        if match and match.group(2) < last_closed:
+            files.append(os.path.join(data_dir, name))
+    return files
+
+
+def read_typed_csv(path):
+    """Lit un fichier CSV jour avec des types explicites par colonne."""
+    df = pd.read_csv(path, dtype={name: "string" for name in TEXT_COLUMNS})
+    for column in df.columns:
+        if column in TIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+        elif column in INTEGER_COLUMNS:
+            df[column] = df[column].astype("Int64")
+        elif column not in TEXT_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    return df
+
+
+def compact_file(csv_path, force=False):
+    """Compacte un fichier CSV en Parquet.
+
+    Retourne la taille du fichier Parquet écrit, 0 s'il était déjà à jour,
+    ou None en cas d'erreur (le CSV est alors conservé tel quel).
+    """
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    if not force and os.path.exists(parquet_path) \
+            and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return 0
+
+    tmp_path = parquet_path + ".tmp"
+    try:
+        df = read_typed_csv(csv_path)
+        df.to_parquet(tmp_path, engine="pyarrow", compression=COMPRESSION, index=False,
+                      row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+        # Vérifier le fichier écrit contre le CSV avant de le garder
+        check = pd.read_parquet(tmp_path)
+        pd.testing.assert_frame_equal(df, check, check_dtype=False)
+        os.replace(tmp_path, parquet_path)
+    except Exception as e:
+        print(f"Erreur lors de la compaction de {csv_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return os.path.getsize(parquet_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compacte les fichiers CSV des jours terminés en Parquet')
+    parser.add_argument('--data-dir', type=str, default=DATA_DIR,
+                       help=f'Répertoire des fichiers de données (défaut: {DATA_DIR})')
+    parser.add_argument('--force', action='store_true',
+                       help='Recompacte même si le fichier Parquet est à jour')
+    parser.add_argument('--delete-csv', action='store_true',
+                       help='Supprime le CSV une fois le Parquet vérifié')
+    args = parser.parse_args()
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("❌ pyarrow est nécessaire pour écrire les fichiers Parquet: pip install pyarrow")
+        return
+
+    csv_bytes = 0
+    parquet_bytes = 0
+    compacted = 0
+    for csv_path in closed_day_files(args.data_dir):
+        size = compact_file(csv_path, args.force)
+        if size is None:
+            continue
+        if size:
+            compacted += 1
+            csv_bytes += os.path.getsize(csv_path)
+            parquet_bytes += size
+            print(f"{os.path.basename(csv_path)} -> {size} octets")
+        if args.delete_csv:
+            os.remove(csv_path)
+
+    print(f"✅ {compacted} fichiers compactés")
+    if csv_bytes:
+        print(f"CSV: {csv_bytes} octets, Parquet: {parquet_bytes} octets "
+              f"({parquet_bytes / csv_bytes * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
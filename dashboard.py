@@ -4,73 +4,247 @@ Dashboard Flask pour visualiser graphiquement les données Pi et Po jour par jou
 Avec navigation entre les jours disponibles
 """
 
-from flask import Flask, render_template_string, request, redirect, url_for
+from flask import Flask, Response, jsonify, render_template_string, request, redirect, stream_with_context, url_for
+import numpy as np
 import pandas as pd
+import plotly
 import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
 from plotly.subplots import make_subplots
 import os
-import glob
-from datetime import datetime
+import re
+import gzip
+import hashlib
+import json
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from energie_schema import FIELDS, ROLLUP_LEVELS
+from energie_store import (
+    CsvTail, binary_frame, read_energie_binary, read_day_table, day_file_fingerprint, load_energie_frame, read_rollup
+)
+from energie_downsample import METHODS, downsample
+from energie_daily import DB_VERSION, day_sources, open_store
 
 app = Flask(__name__)
 
 # Configuration
 DATA_DIR = "data/"
+CACHE_BUDGET = 64 * 1024 * 1024  # mémoire maximale des DataFrames en cache (octets)
+PAGE_CACHE_SIZE = 32  # pages HTML de jours terminés gardées en mémoire
+POINT_BUDGET = 2000  # points par courbe envoyés au navigateur pour la vue par seconde
+OPEN_DAYS = 2  # jours récents dont le bilan peut encore changer (données SolarEdge en retard)
+LIVE_INTERVAL = 5  # secondes entre deux lectures des fichiers du jour pour la vue en direct
+LIVE_WINDOW = 3600  # secondes de données par seconde envoyées à l'ouverture de la vue en direct
+
+class FrameCache:
+    """Cache LRU des fichiers jour lus, dans la limite de `budget` octets.
+
+    Une entrée est valide tant que l'empreinte (mtime, taille) des fichiers
+    lus ne change pas: les jours passés restent en mémoire, le fichier du
+    jour n'est relu que lorsqu'il a été modifié. Un fichier qui n'existe
+    qu'en CSV (le fichier du jour en cours d'écriture) est lu par un
+    CsvTail: seules les lignes complètes ajoutées depuis la lecture
+    précédente sont parsées et ajoutées au DataFrame en cache. Les
+    DataFrames sont retournés en copie superficielle, l'appelant peut
+    ajouter des colonnes.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()  # chemin -> (empreinte, DataFrame, octets)
+        self.tails = {}  # chemin -> CsvTail des fichiers lus incrémentalement
+        self.size = 0
+        self.lock = threading.Lock()
+        self.tail_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self, csv_path, fingerprint):
+        """Lit le fichier jour: par la fin (CsvTail) si seul le CSV existe, sinon en entier"""
+        if len(fingerprint) == 1 and fingerprint[0][0] == os.path.basename(csv_path):
+            with self.tail_lock:
+                tail = self.tails.get(csv_path)
+                if tail is None:
+                    tail = self.tails[csv_path] = CsvTail(csv_path)
+                tail.read()
+                return tail.frame
+        with self.tail_lock:
+            self.tails.pop(csv_path, None)
+        return read_day_table(csv_path)
+
+    def get(self, csv_path):
+        """Retourne le DataFrame du fichier jour `csv_path` (None s'il n'existe pas)."""
+        fingerprint = day_file_fingerprint(csv_path)
+        if not fingerprint:
+            return None
+        with self.lock:
+            entry = self.entries.get(csv_path)
+            if entry is not None and entry[0] == fingerprint:
+                self.entries.move_to_end(csv_path)
+                self.hits += 1
+                return entry[1].copy(deep=False)
+            self.misses += 1
+        df = self._read(csv_path, fingerprint)
+        if df is None:
+            return None
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self.lock:
+            old = self.entries.pop(csv_path, None)
+            if old is not None:
+                self.size -= old[2]
+            if nbytes <= self.budget:
+                self.entries[csv_path] = (fingerprint, df, nbytes)
+                self.size += nbytes
+                # Évincer les fichiers les moins récemment utilisés
+                while self.size > self.budget:
+                    path, (_, _, evicted) = self.entries.popitem(last=False)
+                    self.size -= evicted
+                    self.tails.pop(path, None)
+        return df.copy(deep=False)
+
+frame_cache = FrameCache(CACHE_BUDGET)
+
+# Fichiers listés par l'index des dates: ts_summary_YYYYMMDD.csv et leur version compactée en Parquet
+DATE_FILE_RE = re.compile(r"^ts_summary_(\d{4})(\d{2})(\d{2})\.(?:csv|parquet)$")
+
+class DateIndex:
+    """Liste triée des dates disponibles dans le répertoire des données.
+
+    La liste n'est reconstruite (un seul scandir) que si la date de
+    modification du répertoire a changé, c'est-à-dire quand un fichier y a
+    été créé, renommé ou supprimé. Les recherches se font par bisection.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory  # None: DATA_DIR
+        self.key = None
+        self.dates = []
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Relit le répertoire s'il a changé depuis la dernière lecture et retourne les dates."""
+        directory = self.directory or DATA_DIR
+        try:
+            key = (directory, os.stat(directory).st_mtime_ns)
+        except OSError:
+            self.key, self.dates = None, []
+            return self.dates
+        if key == self.key:
+            return self.dates
+        with self.lock:
+            if key != self.key:
+                dates = set()
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        match = DATE_FILE_RE.match(entry.name)
+                        if match:
+                            try:
+                                dates.add(datetime(*map(int, match.groups())))
+                            except ValueError:
+                                continue
+                # La liste est remplacée, jamais modifiée: les lecteurs gardent une liste cohérente
+                self.dates = sorted(dates)
+                self.key = key
+        return self.dates
+
+    def __contains__(self, date):
+        dates = self.refresh()
+        i = bisect_left(dates, date)
+        return i < len(dates) and dates[i] == date
+
+    def prev(self, date):
+        """Date disponible précédant `date` (la première s'il n'y en a pas), None si aucune date."""
+        dates = self.refresh()
+        if not dates:
+            return None
+        i = bisect_left(dates, date)
+        return dates[max(i - 1, 0)]
+
+    def next(self, date):
+        """Date disponible suivant `date` (la dernière s'il n'y en a pas), None si aucune date."""
+        dates = self.refresh()
+        if not dates:
+            return None
+        i = bisect_right(dates, date)
+        return dates[min(i, len(dates) - 1)]
+
+date_index = DateIndex()
 
 def get_available_dates():
     """Retourne la liste des dates disponibles sous forme de datetime"""
-    csv_files = glob.glob(os.path.join(DATA_DIR, "ts_summary_20*.csv"))
-    dates = []
-    
-    for file in csv_files:
-        # Extraire la date du nom de fichier ts_summary_YYYYMMDD.csv
-        filename = os.path.basename(file)
-        date_str = filename.replace("ts_summary_", "").replace(".csv", "")
-        try:
-            date = datetime.strptime(date_str, "%Y%m%d")
-            dates.append(date)
-        except ValueError:
-            continue
-    
-    return sorted(dates)
+    return date_index.refresh()
 
 def load_day_data(date):
     """Charge les données pour une date donnée"""
     date_str = date.strftime("%Y%m%d")
     filename = os.path.join(DATA_DIR, f"ts_summary_{date_str}.csv")
     
-    if not os.path.exists(filename):
-        return None
-    
     try:
-        df = pd.read_csv(filename)
-        # Convertir la colonne Time en datetime pour un meilleur affichage
-        df['Time'] = pd.to_datetime(df['Time'])
-        return df
+        # Parquet compacté en priorité, sinon CSV (colonne Time convertie en datetime), gardé en cache
+        return frame_cache.get(filename)
     except Exception as e:
         print(f"Erreur lors de la lecture du fichier {filename}: {e}")
         return None
 
-def load_solaredge_data(date):
-    """Charge les données SolarEdge pour une date donnée"""
+daily_store = None  # bilans journaliers (energie_daily), ouverte au premier usage dans DATA_DIR
+daily_store_lock = threading.Lock()
+
+def get_daily_store():
+    """Base des bilans journaliers de DATA_DIR, ouverte au premier appel"""
+    global daily_store
+    with daily_store_lock:
+        if daily_store is None:
+            daily_store = open_store(DATA_DIR)
+    return daily_store
+
+def load_day_summary(date):
+    """Bilan journalier d'une date (index E1/E2/B1/B2 du jour, pics, production PV), None si absent"""
+    try:
+        store = get_daily_store()
+        store.update(date, DATA_DIR)
+        return store.day(date)
+    except Exception as e:
+        print(f"Erreur lors du calcul du bilan du {date:%d/%m/%Y}: {e}")
+        return None
+
+def day_energy(summary):
+    """Énergie consommée du jour (E1, E2, total en kWh) d'après le bilan journalier"""
+    e1 = (summary or {}).get('E1_delta') or 0
+    e2 = (summary or {}).get('E2_delta') or 0
+    return e1, e2, e1 + e2
+
+def has_day_file(filename):
+    """Indique si le fichier CSV jour existe, ou sa version compactée en Parquet"""
+    return os.path.exists(filename) or os.path.exists(os.path.splitext(filename)[0] + ".parquet")
+
+def solaredge_file(date):
+    """Retourne le fichier SolarEdge d'une date donnée, None s'il n'y en a pas"""
     date_str = date.strftime("%Y%m%d")
     filename = os.path.join(DATA_DIR, f"solaredge_power_{date_str}.csv")
     
     # Essayer aussi le format de fichier alternatif
-    if not os.path.exists(filename):
+    if not has_day_file(filename):
         filename = os.path.join(DATA_DIR, f"solaredge_daily_{date_str}.csv")
     
-    if not os.path.exists(filename):
-        # Essayer de trouver un fichier qui contient cette date
-        pattern = os.path.join(DATA_DIR, f"solaredge_power_*{date_str}*")
-        files = glob.glob(pattern)
-        if files:
-            filename = files[0]
-        else:
-            return None
+    if not has_day_file(filename):
+        # Les fichiers par période (solaredge_power_<début>_to_<fin>.csv) sont répartis
+        # par jour par solaredge_fetcher.py
+        return None
+    return filename
+
+def load_solaredge_data(date):
+    """Charge les données SolarEdge pour une date donnée"""
+    filename = solaredge_file(date)
+    if filename is None:
+        return None
     
     try:
-        df = pd.read_csv(filename)
+        df = frame_cache.get(filename)
         
         # Vérifier si le fichier contient les bonnes colonnes
         if 'Time' in df.columns:
@@ -132,7 +306,7 @@ def format_french_date(date):
     
     return f"{jour_semaine} {jour} {mois_nom} {annee}"
 
-def create_plot(df, date, has_solaredge=False):
+def create_plot(df, date, has_solaredge=False, summary=None):
     """Crée un graphique Plotly avec les flux énergétiques détaillés"""
     if df is None or df.empty:
         return None
@@ -259,10 +433,8 @@ def create_plot(df, date, has_solaredge=False):
         barmode='group'  # Mode de regroupement des barres
     )
     
-    # Ajouter des annotations avec les statistiques
-    e1_last = df['E1'].iloc[-1] if 'E1' in df.columns else 0
-    e2_last = df['E2'].iloc[-1] if 'E2' in df.columns else 0
-    e_total = e1_last + e2_last
+    # Ajouter des annotations avec les statistiques (énergie du jour: différence des index cumulés)
+    e1_day, e2_day, e_total = day_energy(summary)
     
     # Statistiques de production solaire si disponible
     if has_solaredge and 'Production_kW' in df.columns and 'Po' in df.columns:
@@ -289,7 +461,7 @@ def create_plot(df, date, has_solaredge=False):
             f"🏡 Taux autoconsommation: {autoconsumption_rate:.1f}%"
         )
     else:
-        stats_text = f"<b>Énergie Consommée</b><br>Haut tarif (E1): {e1_last:.2f} kWh<br>Bas tarif (E2): {e2_last:.2f} kWh<br>Total: {e_total:.2f} kWh"
+        stats_text = f"<b>Énergie Consommée</b><br>Haut tarif (E1): {e1_day:.2f} kWh<br>Bas tarif (E2): {e2_day:.2f} kWh<br>Total: {e_total:.2f} kWh"
     
     fig.add_annotation(
         x=0.5,
@@ -312,6 +484,7 @@ HTML_TEMPLATE = '''
 <html>
 <head>
     <title>Dashboard Énergétique - {{ date_str }}</title>
+    <script src="{{ url_for('plotly_js', version=plotly_version) }}"></script>
     <style>
         body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
@@ -424,6 +597,10 @@ HTML_TEMPLATE = '''
             <div class="nav-buttons">
                 <button class="btn btn-primary" onclick="window.location.href='/prev?current_date={{ current_date_str }}'" {% if not has_prev %}disabled{% endif %}>← Précédent</button>
                 <button class="btn btn-success" onclick="window.location.href='/'">🏠 Aujourd'hui</button>
+                <button class="btn btn-primary" onclick="window.location.href='/seconds/{{ current_date_str }}'">⏱ Par seconde</button>
+                <button class="btn btn-primary" onclick="window.location.href='/week/{{ current_week }}'">📅 Semaine</button>
+                <button class="btn btn-primary" onclick="window.location.href='/chart'">📈 Période</button>
+                <button class="btn btn-danger" onclick="window.location.href='/live'">🔴 Direct</button>
                 <button class="btn btn-primary" onclick="window.location.href='/next?current_date={{ current_date_str }}'" {% if not has_next %}disabled{% endif %}>Suivant →</button>
             </div>
         </div>
@@ -473,11 +650,11 @@ HTML_TEMPLATE = '''
             <h3>📊 Énergie Consommée - {{ date_str }}</h3>
             <div class="stats-content">
                 <div class="stat-item">
-                    <div class="stat-value">{{ e1_last }}</div>
+                    <div class="stat-value">{{ e1_day }}</div>
                     <div class="stat-label">Haut tarif (E1) kWh</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-value">{{ e2_last }}</div>
+                    <div class="stat-value">{{ e2_day }}</div>
                     <div class="stat-label">Bas tarif (E2) kWh</div>
                 </div>
                 <div class="stat-item">
@@ -502,8 +679,6 @@ HTML_TEMPLATE = '''
             Fichier: {{ filename }} | {{ record_count }} enregistrements
         </div>
     </div>
-    
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
 </body>
 </html>
 '''
@@ -527,11 +702,20 @@ def show_specific_date(date_str):
     except ValueError:
         return redirect(url_for('index'))
     
-    available_dates = get_available_dates()
-    if current_date not in available_dates:
+    if current_date not in date_index:
         return redirect(url_for('index'))
     
-    return show_date(current_date, available_dates)
+    return show_date(current_date, get_available_dates())
+
+def requested_date():
+    """Date courante passée en paramètre current_date, None si absente ou invalide"""
+    current_date = request.args.get('current_date')
+    if current_date:
+        try:
+            return datetime.strptime(current_date, "%Y-%m-%d")
+        except ValueError:
+            pass
+    return None
 
 @app.route('/prev')
 def prev_day():
@@ -540,27 +724,9 @@ def prev_day():
     if not available_dates:
         return redirect(url_for('index'))
     
-    # Trouver la date actuelle (dernière visite ou date par défaut)
-    current_date = request.args.get('current_date')
-    if current_date:
-        try:
-            current_date = datetime.strptime(current_date, "%Y-%m-%d")
-        except:
-            current_date = available_dates[-1]
-    else:
-        current_date = available_dates[-1]
-    
-    # Trouver l'index de la date actuelle
-    try:
-        current_index = available_dates.index(current_date)
-    except ValueError:
-        current_index = len(available_dates) - 1
-    
-    # Aller au jour précédent
-    if current_index > 0:
-        new_date = available_dates[current_index - 1]
-    else:
-        new_date = available_dates[0]
+    # Date actuelle, ou la plus récente par défaut
+    current_date = requested_date() or available_dates[-1]
+    new_date = date_index.prev(current_date)
     
     return redirect(url_for('show_specific_date', date_str=new_date.strftime("%Y-%m-%d")))
 
@@ -571,36 +737,90 @@ def next_day():
     if not available_dates:
         return redirect(url_for('index'))
     
-    # Trouver la date actuelle
-    current_date = request.args.get('current_date')
-    if current_date:
-        try:
-            current_date = datetime.strptime(current_date, "%Y-%m-%d")
-        except:
-            current_date = available_dates[-1]
-    else:
-        current_date = available_dates[-1]
+    # Date actuelle, ou la plus récente par défaut
+    current_date = requested_date() or available_dates[-1]
+    new_date = date_index.next(current_date)
     
-    # Trouver l'index de la date actuelle
-    try:
-        current_index = available_dates.index(current_date)
-    except ValueError:
-        current_index = len(available_dates) - 1
+    return redirect(url_for('show_specific_date', date_str=new_date.strftime("%Y-%m-%d")))
+
+# Pages HTML déjà rendues des jours terminés, indexées par ETag
+page_cache = OrderedDict()
+page_cache_lock = threading.Lock()
+plotly_js_bytes = None
+
+@app.route('/plotly-<version>.min.js')
+def plotly_js(version):
+    """plotly.js servi localement une seule fois, mis en cache par le navigateur (URL versionnée)"""
+    global plotly_js_bytes
+    if plotly_js_bytes is None:
+        plotly_js_bytes = get_plotlyjs().encode()
+    response = Response(plotly_js_bytes, mimetype='application/javascript')
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    response.set_etag(plotly.__version__)
+    return response.make_conditional(request)
+
+def page_validators(current_date, has_prev, has_next):
+    """ETag et date de dernière modification de la page d'un jour.
+
+    Calculés à partir de l'empreinte (mtime, taille) des fichiers lus, sans
+    les lire: la page ne change que si un de ces fichiers change, y compris
+    les sources du bilan journalier (rollup 1h, données par seconde).
+    """
+    date_str = current_date.strftime("%Y%m%d")
+    files = [os.path.join(DATA_DIR, f"ts_summary_{date_str}.csv"), solaredge_file(current_date)]
+    files += [path for path in day_sources(current_date, DATA_DIR) if path not in files]
+    fingerprints = tuple(day_file_fingerprint(f) if f else () for f in files)
+    key = (date_str, fingerprints, DB_VERSION, has_prev, has_next, plotly.__version__)
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    mtimes = [mtime for fingerprint in fingerprints for _, mtime, _ in fingerprint]
+    last_modified = datetime.fromtimestamp(max(mtimes) / 1e9, tz=timezone.utc) if mtimes else None
+    return etag, last_modified
+
+def show_date(current_date, available_dates):
+    """Affiche les données pour une date donnée.
+
+    La page porte un ETag et un Last-Modified: le navigateur reçoit une réponse
+    304 tant que les fichiers du jour n'ont pas changé. Les pages des jours
+    terminés sont gardées en mémoire.
+    """
+    # Déterminer si les boutons précédent/suivant doivent être activés
+    has_prev = current_date > available_dates[0]
+    has_next = current_date < available_dates[-1]
+    etag, last_modified = page_validators(current_date, has_prev, has_next)
+    closed = current_date.date() < datetime.now().date()
     
-    # Aller au jour suivant
-    if current_index < len(available_dates) - 1:
-        new_date = available_dates[current_index + 1]
+    if etag in request.if_none_match:
+        html = None  # réponse 304, rien à rendre
     else:
-        new_date = available_dates[-1]
+        with page_cache_lock:
+            html = page_cache.get(etag)
+            if html is not None:
+                page_cache.move_to_end(etag)
+        if html is None:
+            html = render_day(current_date, has_prev, has_next)
+            if html is None:
+                return f"Aucune donnée disponible pour le {current_date.strftime('%d/%m/%Y')}"
+            if closed:
+                with page_cache_lock:
+                    page_cache[etag] = html
+                    while len(page_cache) > PAGE_CACHE_SIZE:
+                        page_cache.popitem(last=False)
     
-    return redirect(url_for('show_specific_date', date_str=new_date.strftime("%Y-%m-%d")))
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Toujours revalider: la page du jour change à chaque nouvelle donnée
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-def show_date(current_date, available_dates):
-    """Affiche les données pour une date donnée"""
+def render_day(current_date, has_prev, has_next):
+    """Rend la page HTML d'une date, None s'il n'y a pas de données"""
     df = load_day_data(current_date)
     
     if df is None or df.empty:
-        return f"Aucune donnée disponible pour le {current_date.strftime('%d/%m/%Y')}"
+        return None
     
     # Charger les données SolarEdge
     solaredge_df = load_solaredge_data(current_date)
@@ -612,18 +832,20 @@ def show_date(current_date, available_dates):
     else:
         has_solaredge = False
     
+    # Bilan du jour (table SQLite mise à jour si les fichiers du jour ont changé)
+    summary = load_day_summary(current_date)
+    
     # Créer le graphique
-    fig = create_plot(df, current_date, has_solaredge)
-    plot_html = fig.to_html(full_html=False)
+    fig = create_plot(df, current_date, has_solaredge, summary)
+    # plotly.js est chargé une fois par la page (route plotly_js), pas inclus dans chaque graphique
+    plot_html = fig.to_html(full_html=False, include_plotlyjs=False)
     
     # Calculer les statistiques
     pi_max = df['Pi'].max()
     po_max = df['Po'].max()
     
-    # Calculer l'énergie consommée (dernières valeurs de E1 et E2)
-    e1_last = df['E1'].iloc[-1] if 'E1' in df.columns else 0
-    e2_last = df['E2'].iloc[-1] if 'E2' in df.columns else 0
-    e_total = e1_last + e2_last
+    # Énergie consommée dans la journée: dernière moins première valeur des index E1 et E2
+    e1_day, e2_day, e_total = day_energy(summary)
     
     # Calculer la production solaire et les flux énergétiques si disponible
     if has_solaredge and 'Production_kW' in df.columns and 'Po' in df.columns:
@@ -645,18 +867,13 @@ def show_date(current_date, available_dates):
         grid_to_home = 0
         autoconsumption_rate = 0
     
-    # Déterminer si les boutons précédent/suivant doivent être activés
-    current_index = available_dates.index(current_date)
-    has_prev = current_index > 0
-    has_next = current_index < len(available_dates) - 1
-    
     return render_template_string(
         HTML_TEMPLATE,
         date_str=format_french_date(current_date),
         current_date_str=current_date.strftime('%Y-%m-%d'),
         plot_html=plot_html,
-        e1_last=f"{e1_last:.3f}",
-        e2_last=f"{e2_last:.3f}",
+        e1_day=f"{e1_day:.3f}",
+        e2_day=f"{e2_day:.3f}",
         e_total=f"{e_total:.3f}",
         solar_production=f"{solar_production:.3f}",
         solar_max=f"{solar_max:.3f}",
@@ -667,9 +884,608 @@ def show_date(current_date, available_dates):
         pi_max=f"{pi_max:.3f}",
         po_max=f"{po_max:.3f}",
         has_solaredge=has_solaredge,
+        current_week=current_date.strftime('%G-W%V'),
         filename=f"ts_summary_{current_date.strftime('%Y%m%d')}.csv",
         has_prev=has_prev,
-        has_next=has_next
+        has_next=has_next,
+        plotly_version=plotly.__version__
+    )
+
+SECONDS_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dashboard Énergétique - {{ date_str }} par seconde</title>
+    <script src="{{ url_for('plotly_js', version=plotly_version) }}"></script>
+    <style>
+        body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background-color: white; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
+        .header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px; }
+        .title { color: #2c3e50; font-size: 24px; font-weight: bold; }
+        .file-info { text-align: center; margin-top: 20px; color: #7f8c8d; font-size: 14px; }
+        a { color: #3498db; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <div class="title">⏱ {{ date_str }} - par seconde</div>
+            <div>
+                <a href="/date/{{ current_date_str }}">← Retour au jour</a> |
+                {% for m in methods %}<a href="?method={{ m }}&points={{ points }}">{{ m }}</a> {% endfor %}
+            </div>
+        </div>
+        <div id="plot">{{ plot_html|safe }}</div>
+        <div class="file-info">
+            {{ shown }} points affichés sur {{ total }} secondes ({{ method }})
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+def create_seconds_plot(df, date, points, method):
+    """Graphique des puissances par seconde, chaque courbe réduite à `points` points"""
+    fig = go.Figure()
+    shown = 0
+    for column, name, color in (("Pi", "Consommation (kW)", "royalblue"), ("Po", "Injection (kW)", "green")):
+        if column not in df.columns:
+            continue
+        x, y = downsample(df['Time'].values, df[column].values, points, method)
+        shown += len(x)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=name, line=dict(color=color, width=1)))
+    fig.update_xaxes(title_text="Heure", tickformat="%H:%M", showgrid=True, gridcolor='lightgray')
+    fig.update_yaxes(title_text="Puissance (kW)", showgrid=True, gridcolor='lightgray')
+    fig.update_layout(
+        height=600,
+        title_text=f"Puissance par seconde - {format_french_date(date)}",
+        template="plotly_white",
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig, shown
+
+@app.route('/seconds/<date_str>')
+def show_seconds(date_str):
+    """Vue par seconde d'une date (energie_YYYYMMDD), réduite à un budget de points par courbe"""
+    try:
+        current_date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return redirect(url_for('index'))
+    points = min(max(request.args.get('points', POINT_BUDGET, type=int), 100), 20000)
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        method = 'lttb'
+    
+    try:
+        df = load_energie_frame(current_date, DATA_DIR)
+    except Exception as e:
+        print(f"Erreur lors de la lecture des données par seconde du {date_str}: {e}")
+        df = None
+    if df is None or df.empty:
+        return f"Aucune donnée par seconde disponible pour le {current_date.strftime('%d/%m/%Y')}"
+    
+    fig, shown = create_seconds_plot(df, current_date, points, method)
+    return render_template_string(
+        SECONDS_TEMPLATE,
+        date_str=format_french_date(current_date),
+        current_date_str=date_str,
+        plot_html=fig.to_html(full_html=False, include_plotlyjs=False),
+        plotly_version=plotly.__version__,
+        methods=METHODS,
+        method=method,
+        points=points,
+        shown=shown,
+        total=len(df)
+    )
+
+# --- Vues semaine, mois et année (bilans journaliers et horaires précalculés) ---
+
+PERIOD_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dashboard Énergétique - {{ title }}</title>
+    <script src="{{ url_for('plotly_js', version=plotly_version) }}"></script>
+    <style>
+        body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background-color: white; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
+        .header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px; }
+        .title { color: #2c3e50; font-size: 24px; font-weight: bold; }
+        .stats { display: flex; justify-content: space-around; flex-wrap: wrap; margin-top: 20px; }
+        .stat-item { text-align: center; padding: 10px; }
+        .stat-value { font-size: 22px; font-weight: bold; color: #2c3e50; }
+        .stat-label { font-size: 13px; color: #7f8c8d; }
+        a { color: #3498db; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <div class="title">📅 {{ title }}</div>
+            <div>
+                <a href="{{ prev_url }}">← Précédent</a> |
+                <a href="{{ next_url }}">Suivant →</a> |
+                {% for label, url in views %}<a href="{{ url }}">{{ label }}</a> {% endfor %}|
+                <a href="/">🏠 Aujourd'hui</a>
+            </div>
+        </div>
+        <div id="plot">{{ plot_html|safe }}</div>
+        <div class="stats">
+            <div class="stat-item"><div class="stat-value">{{ consumption }}</div><div class="stat-label">Consommation E1+E2 (kWh)</div></div>
+            <div class="stat-item"><div class="stat-value">{{ injection }}</div><div class="stat-label">Injection B1+B2 (kWh)</div></div>
+            <div class="stat-item"><div class="stat-value">{{ pv }}</div><div class="stat-label">Production PV (kWh)</div></div>
+            <div class="stat-item"><div class="stat-value">{{ pi_max }}</div><div class="stat-label">Pi Maximum (kW)</div></div>
+            <div class="stat-item"><div class="stat-value">{{ days }}</div><div class="stat-label">Jours avec données</div></div>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+def refresh_summaries(store, start, end):
+    """Calcule les bilans manquants de la période et met à jour les jours encore ouverts.
+
+    Les jours terminés ne sont calculés qu'une fois: le coût d'une page ne
+    dépend pas du nombre de fichiers jour de la période.
+    """
+    stored = {row["date"] for row in store.range(start, end) if row["fingerprint"] is not None}
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = date_index.refresh()
+    for date in dates[bisect_left(dates, start):bisect_right(dates, end)]:
+        if date.strftime("%Y-%m-%d") not in stored or date > today - timedelta(days=OPEN_DAYS):
+            store.update(date, DATA_DIR)
+
+def create_period_plot(days, hours, title):
+    """Barres par jour (consommation, injection, PV) et, si `hours` est donné, énergie heure par heure"""
+    rows = 2 if hours else 1
+    fig = make_subplots(rows=rows, cols=1, vertical_spacing=0.12,
+                        subplot_titles=["Énergie par jour (kWh)"] + (["Énergie par heure (kWh)"] if hours else []))
+    dates = [row["date"] for row in days]
+    consumption = [(row["E1_delta"] or 0) + (row["E2_delta"] or 0) for row in days]
+    injection = [(row["B1_delta"] or 0) + (row["B2_delta"] or 0) for row in days]
+    fig.add_trace(go.Bar(x=dates, y=consumption, name="Consommation (E1+E2)", marker_color="royalblue"), row=1, col=1)
+    fig.add_trace(go.Bar(x=dates, y=injection, name="Injection (B1+B2)", marker_color="green"), row=1, col=1)
+    if any(row["pv_kwh"] is not None for row in days):
+        fig.add_trace(go.Bar(x=dates, y=[row["pv_kwh"] for row in days], name="Production PV",
+                             marker_color="orange"), row=1, col=1)
+    if hours:
+        times = [row["time"] + ":00" for row in hours]
+        for column, name, color in (("Pi", "Consommation (Pi)", "royalblue"), ("Po", "Injection (Po)", "green"),
+                                    ("pv", "Production PV", "orange")):
+            values = [row[column] for row in hours]
+            if any(value is not None for value in values):
+                fig.add_trace(go.Scatter(x=times, y=values, mode="lines", name=name, showlegend=False,
+                                         line=dict(color=color, width=1)), row=2, col=1)
+    fig.update_layout(
+        height=450 * rows,
+        title_text=title,
+        template="plotly_white",
+        hovermode="x unified",
+        barmode="group",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+def show_period(title, start, end, prev_url, next_url, hourly=True):
+    """Page d'une période: tout est lu dans la base des bilans, jamais dans les fichiers jour"""
+    try:
+        store = get_daily_store()
+        refresh_summaries(store, start, end)
+        days = store.range(start, end)
+        hours = store.hours(start, end) if hourly else []
+        totals = store.totals(start, end)
+    except Exception as e:
+        print(f"Erreur lors de la lecture des bilans du {start:%d/%m/%Y} au {end:%d/%m/%Y}: {e}")
+        days = []
+    if not days:
+        return f"Aucune donnée disponible du {start:%d/%m/%Y} au {end:%d/%m/%Y}"
+    
+    fig = create_period_plot(days, hours, title)
+    consumption = (totals["E1"] or 0) + (totals["E2"] or 0)
+    injection = (totals["B1"] or 0) + (totals["B2"] or 0)
+    return render_template_string(
+        PERIOD_TEMPLATE,
+        title=title,
+        plot_html=fig.to_html(full_html=False, include_plotlyjs=False),
+        plotly_version=plotly.__version__,
+        prev_url=prev_url,
+        next_url=next_url,
+        views=[("Semaine", url_for('show_week', iso=start.strftime('%G-W%V'))),
+               ("Mois", url_for('show_month', month=start.strftime('%Y-%m'))),
+               ("Année", url_for('show_year', year=start.year))],
+        consumption=f"{consumption:.3f}",
+        injection=f"{injection:.3f}",
+        pv=f"{totals['pv_kwh']:.3f}",
+        pi_max=f"{totals['Pi_max'] or 0:.3f}",
+        days=totals["days"]
+    )
+
+@app.route('/week/<iso>')
+def show_week(iso):
+    """Semaine ISO: /week/2026-W05"""
+    try:
+        start = datetime.strptime(iso + "-1", "%G-W%V-%u")
+    except ValueError:
+        return redirect(url_for('index'))
+    end = start + timedelta(days=6)
+    return show_period(
+        f"Semaine {start:%V} ({start:%d/%m} - {end:%d/%m/%Y})", start, end,
+        url_for('show_week', iso=(start - timedelta(days=7)).strftime('%G-W%V')),
+        url_for('show_week', iso=(start + timedelta(days=7)).strftime('%G-W%V'))
+    )
+
+@app.route('/month/<month>')
+def show_month(month):
+    """Mois: /month/2026-01"""
+    try:
+        start = datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        return redirect(url_for('index'))
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    mois = ["janvier", "février", "mars", "avril", "mai", "juin",
+            "juillet", "août", "septembre", "octobre", "novembre", "décembre"]
+    return show_period(
+        f"{mois[start.month - 1].capitalize()} {start.year}", start, end,
+        url_for('show_month', month=(start - timedelta(days=1)).strftime('%Y-%m')),
+        url_for('show_month', month=(end + timedelta(days=1)).strftime('%Y-%m'))
+    )
+
+@app.route('/year/<int:year>')
+def show_year(year):
+    """Année: /year/2026 (barres par jour seulement)"""
+    if not 1970 <= year <= 9999:
+        return redirect(url_for('index'))
+    return show_period(
+        f"Année {year}", datetime(year, 1, 1), datetime(year, 12, 31),
+        url_for('show_year', year=year - 1), url_for('show_year', year=year + 1), hourly=False
+    )
+
+# --- API de données (format colonnes) ---
+
+API_RESOLUTIONS = ("ts", "1s") + tuple(ROLLUP_LEVELS)  # ts: résumés 5 minutes, 1s: par seconde
+API_MAX_DAYS = 366  # nombre maximal de jours d'une requête /api/range (1 pour la résolution 1s)
+API_CACHE_SIZE = 64  # réponses gardées en mémoire
+API_MAGIC = b"ENRGAPI1"
+
+api_cache = OrderedDict()
+api_cache_lock = threading.Lock()
+
+def api_error(message, status=400):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+def api_sources(date, res):
+    """Fichiers lus pour une date et une résolution (pour l'empreinte des réponses)"""
+    date_str = date.strftime("%Y%m%d")
+    energie = [os.path.join(DATA_DIR, f"energie_{date_str}.bin"), os.path.join(DATA_DIR, f"energie_{date_str}.csv")]
+    if res == "ts":
+        return [os.path.join(DATA_DIR, f"ts_summary_{date_str}.csv")]
+    if res == "1s":
+        return energie
+    return [os.path.join(DATA_DIR, f"rollup_{res}_{date_str}.csv")] + energie
+
+def api_day_frame(date, res):
+    """DataFrame d'une date à la résolution `res`, None s'il n'y a pas de données"""
+    if res == "ts":
+        return load_day_data(date)
+    if res == "1s":
+        return load_energie_frame(date, DATA_DIR)
+    return read_rollup(date, res, DATA_DIR)
+
+def columnar_payload(df, fields, fmt):
+    """Sérialise `df` en colonnes: début (secondes depuis 1970, heure locale), décalages et valeurs.
+
+    JSON: {"start", "count", "t": [décalages en s], "fields": {nom: [valeurs ou null]}}.
+    Binaire: API_MAGIC, longueur de l'en-tête JSON (uint32), en-tête {"start",
+    "count", "fields"}, décalages uint32[count] puis float32[count] par champ.
+    """
+    times = df["Time"].values.astype("datetime64[s]").astype(np.int64)
+    start = int(times[0]) if len(times) else 0
+    offsets = (times - start).astype(np.uint32)
+    if fmt == "bin":
+        header = json.dumps({"start": start, "count": len(df), "fields": fields}).encode()
+        parts = [API_MAGIC, struct.pack("<I", len(header)), header, offsets.astype("<u4").tobytes()]
+        for name in fields:
+            parts.append(df[name].to_numpy(dtype="<f4", na_value=np.nan).tobytes())
+        return b"".join(parts), "application/octet-stream"
+    columns = {}
+    for name in fields:
+        values = df[name].to_numpy(dtype=float, na_value=np.nan)
+        columns[name] = [None if v != v else round(v, 4) for v in values.tolist()]
+    payload = {"start": start, "count": len(df), "t": offsets.tolist(), "fields": columns}
+    return json.dumps(payload, separators=(",", ":")).encode(), "application/json"
+
+def requested_fields(default=""):
+    """Champs demandés par le paramètre `fields` et liste des noms refusés.
+
+    Seuls les champs numériques du compteur (energie_schema.FIELDS) peuvent
+    être demandés: TS, Time ou un nom inconnu sont refusés.
+    """
+    requested = [f for f in request.args.get("fields", default).split(",") if f]
+    return requested, [name for name in requested if name not in FIELDS]
+
+def api_response(dates, res):
+    """Réponse de l'API pour une liste de dates: depuis le cache si les fichiers n'ont pas changé"""
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "bin"):
+        return api_error("format doit être json ou bin")
+    requested, invalid = requested_fields()
+    if invalid:
+        return api_error(f"champs inconnus ou non numériques: {', '.join(invalid)}")
+    fingerprint = tuple(day_file_fingerprint(path) for date in dates for path in api_sources(date, res))
+    key = (tuple(dates), res, fmt, tuple(requested), fingerprint)
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    with api_cache_lock:
+        entry = api_cache.get(etag)
+        if entry is not None:
+            api_cache.move_to_end(etag)
+    if entry is None:
+        frames = []
+        for date in dates:
+            try:
+                df = api_day_frame(date, res)
+            except Exception as e:
+                print(f"Erreur lors de la lecture des données du {date:%d/%m/%Y} ({res}): {e}")
+                df = None
+            if df is not None and not df.empty:
+                frames.append(df)
+        if not frames:
+            return api_error("aucune donnée pour cette période", 404)
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        fields = requested or [name for name in FIELDS if name in df.columns]
+        missing = [name for name in fields if name not in df.columns]
+        if missing:
+            return api_error(f"champs inconnus: {', '.join(missing)}")
+        body, mimetype = columnar_payload(df, fields, fmt)
+        entry = {"body": body, "mimetype": mimetype, "gzip": None}
+        with api_cache_lock:
+            api_cache[etag] = entry
+            while len(api_cache) > API_CACHE_SIZE:
+                api_cache.popitem(last=False)
+    
+    body = entry["body"]
+    response = Response(mimetype=entry["mimetype"])
+    if "gzip" in request.accept_encodings and len(body) > 1024:
+        if entry["gzip"] is None:
+            entry["gzip"] = gzip.compress(body, 6)
+        body = entry["gzip"]
+        response.headers["Content-Encoding"] = "gzip"
+    response.set_data(body)
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/day/<date_str>')
+def api_day(date_str):
+    """Données d'une date: /api/day/2026-01-28?res=1min&fields=Pi,Po&format=json"""
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return api_error("date attendue au format AAAA-MM-JJ")
+    res = request.args.get("res", "ts")
+    if res not in API_RESOLUTIONS:
+        return api_error(f"res doit être l'une de {', '.join(API_RESOLUTIONS)}")
+    return api_response([date], res)
+
+@app.route('/api/range')
+def api_range():
+    """Données d'une période: /api/range?from=2026-01-01&to=2026-01-31&res=1h"""
+    try:
+        start = datetime.strptime(request.args.get("from", ""), "%Y-%m-%d")
+        end = datetime.strptime(request.args.get("to", ""), "%Y-%m-%d")
+    except ValueError:
+        return api_error("from et to attendus au format AAAA-MM-JJ")
+    res = request.args.get("res", "1h")
+    if res not in API_RESOLUTIONS:
+        return api_error(f"res doit être l'une de {', '.join(API_RESOLUTIONS)}")
+    days = (end - start).days + 1
+    if days < 1 or days > (1 if res == "1s" else API_MAX_DAYS):
+        return api_error("période invalide ou trop longue pour cette résolution")
+    return api_response([start + timedelta(days=i) for i in range(days)], res)
+
+CHART_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dashboard Énergétique - graphique</title>
+    <script src="{{ url_for('plotly_js', version=plotly_version) }}"></script>
+    <style>
+        body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background-color: white; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
+        form { display: flex; gap: 10px; align-items: center; flex-wrap: wrap; margin-bottom: 15px; }
+        #info { text-align: center; color: #7f8c8d; font-size: 14px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <form id="query">
+            <label>Du <input type="date" name="from" value="{{ start }}"></label>
+            <label>au <input type="date" name="to" value="{{ end }}"></label>
+            <label>Résolution <select name="res">
+                {% for r in resolutions %}<option value="{{ r }}" {% if r == res %}selected{% endif %}>{{ r }}</option>{% endfor %}
+            </select></label>
+            <label>Champs <input type="text" name="fields" value="Pi,Po"></label>
+            <button type="submit">Afficher</button>
+        </form>
+        <div id="plot" style="height: 600px;"></div>
+        <div id="info"></div>
+    </div>
+    <script>
+    // Les données arrivent en colonnes: l'heure locale est start + t[i] secondes
+    function draw(event) {
+        if (event) event.preventDefault();
+        const params = new URLSearchParams(new FormData(document.getElementById('query')));
+        const info = document.getElementById('info');
+        info.textContent = 'Chargement...';
+        fetch('/api/range?' + params).then(r => r.json()).then(data => {
+            if (data.error) { info.textContent = data.error; return; }
+            const x = data.t.map(o => new Date((data.start + o) * 1000).toISOString().slice(0, 19));
+            const traces = Object.entries(data.fields).map(([name, y]) =>
+                ({x: x, y: y, name: name, type: 'scattergl', mode: 'lines', line: {width: 1}}));
+            Plotly.react('plot', traces, {template: 'plotly_white', hovermode: 'x unified',
+                                          yaxis: {title: {text: 'Puissance (kW)'}}, margin: {t: 30}});
+            info.textContent = data.count + ' points';
+        });
+    }
+    document.getElementById('query').addEventListener('submit', draw);
+    draw();
+    </script>
+</body>
+</html>
+'''
+
+@app.route('/chart')
+def chart():
+    """Page statique: le graphique est dessiné dans le navigateur à partir de /api/range"""
+    dates = get_available_dates()
+    end = dates[-1] if dates else datetime.now()
+    return render_template_string(
+        CHART_TEMPLATE,
+        plotly_version=plotly.__version__,
+        resolutions=API_RESOLUTIONS,
+        res="15min",
+        start=(end - timedelta(days=6)).strftime("%Y-%m-%d"),
+        end=end.strftime("%Y-%m-%d")
+    )
+
+# --- Vue en direct (Server-Sent Events) ---
+
+def live_rows(date, res, after):
+    """Nombre de lignes du jour `date` et lignes à partir de la ligne `after` ((0, None) sans fichier).
+
+    Résolution 1s: le fichier binaire s'il existe et qu'il est complet
+    (projeté en mémoire, seule la fin est copiée), sinon le CSV lu par la fin
+    via le cache. Résolution ts: les résumés 5 minutes.
+    """
+    date_str = date.strftime("%Y%m%d")
+    if res == "1s":
+        segments = read_energie_binary(date_str, DATA_DIR)
+        if segments is not None:
+            return sum(len(data) for data in segments), binary_frame(segments, after)
+        df = frame_cache.get(os.path.join(DATA_DIR, f"energie_{date_str}.csv"))
+    else:
+        df = load_day_data(date)
+    if df is None:
+        return 0, None
+    return len(df), df.iloc[after:]
+
+def live_events(res, fields):
+    """Flux SSE: `reset` au changement de jour ou de fichier, puis `points` à chaque ajout de lignes"""
+    yield f"retry: {LIVE_INTERVAL * 1000}\n\n"
+    date, sent = None, 0
+    while True:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            total, rows = live_rows(today, res, sent if today == date else 0)
+        except Exception as e:
+            print(f"Erreur lors de la lecture des données en direct ({res}): {e}")
+            total, rows = sent, None
+        if today != date or total < sent:
+            # Nouveau jour, ou fichier remplacé ou raccourci: le client repart de zéro
+            date, sent = today, 0
+            yield f"event: reset\ndata: {today:%Y-%m-%d}\n\n"
+        if rows is not None and not rows.empty:
+            if not sent and res == "1s":
+                rows = rows.iloc[-LIVE_WINDOW:]
+            sent = total
+            names = [name for name in fields if name in rows.columns]
+            body, _ = columnar_payload(rows, names, "json")
+            yield f"event: points\ndata: {body.decode()}\n\n"
+        else:
+            yield ": ping\n\n"  # garde la connexion ouverte et détecte la déconnexion du client
+        time.sleep(LIVE_INTERVAL)
+
+@app.route('/api/live')
+def api_live():
+    """Flux Server-Sent Events des nouvelles lignes du jour: /api/live?res=1s&fields=Pi,Po"""
+    res = request.args.get("res", "1s")
+    if res not in ("ts", "1s"):
+        return api_error("res doit être ts ou 1s")
+    fields, invalid = requested_fields("Pi,Po")
+    if invalid:
+        return api_error(f"champs inconnus ou non numériques: {', '.join(invalid)}")
+    response = Response(stream_with_context(live_events(res, fields)), mimetype="text/event-stream")
+    response.cache_control.no_cache = True
+    response.headers["X-Accel-Buffering"] = "no"  # pas de mise en tampon par un proxy nginx
+    return response
+
+LIVE_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dashboard Énergétique - en direct</title>
+    <script src="{{ url_for('plotly_js', version=plotly_version) }}"></script>
+    <style>
+        body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }
+        .container { max-width: 1200px; margin: 0 auto; background-color: white; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); padding: 20px; }
+        .header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 20px; }
+        .title { color: #2c3e50; font-size: 24px; font-weight: bold; }
+        #info { text-align: center; color: #7f8c8d; font-size: 14px; }
+        a { color: #3498db; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <div class="title">🔴 En direct</div>
+            <div>
+                <a href="/">← Retour</a> |
+                <a href="?res=1s">par seconde</a> <a href="?res=ts">5 minutes</a>
+            </div>
+        </div>
+        <div id="plot" style="height: 600px;"></div>
+        <div id="info">Connexion...</div>
+    </div>
+    <script>
+    // Les points arrivent en colonnes (même format que /api/day): l'heure locale est start + t[i] secondes
+    const maxPoints = {{ max_points }};
+    const info = document.getElementById('info');
+    let names = [];
+    function reset(day) {
+        names = [];
+        Plotly.newPlot('plot', [], {template: 'plotly_white', hovermode: 'x unified', title: {text: day},
+                                    yaxis: {title: {text: 'Puissance (kW)'}}, margin: {t: 40}});
+    }
+    const source = new EventSource('/api/live?res={{ res }}');
+    source.addEventListener('reset', e => reset(e.data));
+    source.addEventListener('points', e => {
+        const data = JSON.parse(e.data);
+        const x = data.t.map(o => new Date((data.start + o) * 1000).toISOString().slice(0, 19));
+        const fields = Object.keys(data.fields);
+        if (!names.length) {
+            names = fields;
+            Plotly.addTraces('plot', fields.map(name =>
+                ({x: [], y: [], name: name, type: 'scattergl', mode: 'lines', line: {width: 1}})));
+        }
+        Plotly.extendTraces('plot', {x: names.map(() => x), y: names.map(name => data.fields[name])},
+                            names.map((_, i) => i), maxPoints);
+        info.textContent = 'Dernier point: ' + x[x.length - 1];
+    });
+    source.onerror = () => { info.textContent = 'Connexion perdue, nouvelle tentative...'; };
+    </script>
+</body>
+</html>
+'''
+
+@app.route('/live')
+def live():
+    """Graphique du jour mis à jour en direct par /api/live"""
+    res = request.args.get("res", "1s")
+    if res not in ("ts", "1s"):
+        res = "1s"
+    return render_template_string(
+        LIVE_TEMPLATE,
+        plotly_version=plotly.__version__,
+        res=res,
+        max_points=LIVE_WINDOW if res == "1s" else 24 * 12
     )
 
 if __name__ == '__main__':
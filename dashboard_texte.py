@@ -4,12 +4,13 @@ Version texte du dashboard pour visualiser les données Pi et Po
 Affiche un graphique ASCII avec Pi en positif et Po en négatif
 """
 
-import pandas as pd
 import glob
 import os
 from datetime import datetime
 import numpy as np
 
+from energie_store import read_day_table
+
 def format_french_date(date):
     """Formate une date en français"""
     jours = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
@@ -25,15 +26,17 @@ def format_french_date(date):
 
 def get_available_dates(data_dir="data/"):
     """Retourne la liste des dates disponibles"""
+    # Fichiers CSV et fichiers compactés en Parquet
     csv_files = glob.glob(os.path.join(data_dir, "ts_summary_20*.csv"))
-    dates = []
+    csv_files += glob.glob(os.path.join(data_dir, "ts_summary_20*.parquet"))
+    dates = set()
     
     for file in csv_files:
         filename = os.path.basename(file)
-        date_str = filename.replace("ts_summary_", "").replace(".csv", "")
+        date_str = os.path.splitext(filename)[0].replace("ts_summary_", "")
         try:
             date = datetime.strptime(date_str, "%Y%m%d")
-            dates.append(date)
+            dates.add(date)
         except ValueError:
             continue
     
@@ -44,13 +47,9 @@ def load_day_data(date, data_dir="data/"):
     date_str = date.strftime("%Y%m%d")
     filename = os.path.join(data_dir, f"ts_summary_{date_str}.csv")
     
-    if not os.path.exists(filename):
-        return None
-    
     try:
-        df = pd.read_csv(filename)
-        df['Time'] = pd.to_datetime(df['Time'])
-        return df
+        # Parquet compacté en priorité, sinon CSV
+        return read_day_table(filename)
     except Exception as e:
         print(f"Erreur: {e}")
         return None
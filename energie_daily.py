@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Table des bilans journaliers (une ligne par jour) dans une base SQLite.
+
+Les index E1, E2, B1, B2 du compteur sont cumulés (plusieurs milliers de
+kWh): l'énergie d'un jour est la différence entre la dernière et la
+première valeur du jour. Pour chaque jour la table garde ces valeurs et
+leurs différences, les pics de Pi/Po, le nombre d'échantillons et la
+production PV du jour. Une seconde table garde l'énergie de chaque heure
+(consommation Pi, injection Po, production PV) pour les vues semaine et mois.
+
+Une ligne est recalculée seulement quand l'empreinte (mtime, taille) des
+fichiers du jour a changé: après la première construction, une mise à jour
+ne relit que le jour en cours. Les requêtes sur une période (une semaine,
+des années) ne lisent que la table.
+
+Sources d'un jour AAAAMMJJ, dans le répertoire des données:
+- `ts_summary_AAAAMMJJ.csv` (ou .parquet): index et puissances toutes les 5 minutes;
+- `rollup_1h_AAAAMMJJ.csv` (ou calculé à partir de `energie_AAAAMMJJ`):
+  première/dernière valeur des index et pics à la seconde;
+- `energie_AAAAMMJJ.bin` (ou .csv): nombre de secondes ayant au moins un
+  échantillon;
+- `solaredge_power_AAAAMMJJ.csv`, sinon `solaredge_daily_AAAAMMJJ.csv`: production PV.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from energie_schema import COUNTER_FIELDS
+from energie_store import day_file_fingerprint, load_energie_frame, read_day_table, read_rollup
+
+DATA_DIR = "data/"
+# Base dans un sous-répertoire: chaque commit crée et supprime son journal, ce qui changerait la date
+# de modification de DATA_DIR (utilisée par l'index des dates du dashboard)
+DB_DIR = ".cache"
+DB_FILE = "energie_daily.sqlite"
+DB_VERSION = 1  # incrémentée quand le calcul d'une colonne change: tous les jours sont recalculés
+
+# Colonnes de la table, après `date` (AAAA-MM-JJ) et `fingerprint`
+COLUMNS = (
+    [f"{name}_{stat}" for name in COUNTER_FIELDS for stat in ("first", "last", "delta")]
+    + ["Pi_max", "Po_max", "samples", "seconds", "pv_kwh", "pv_max_kw"]
+)
+
+# Colonnes de la table des heures, après `time` (AAAA-MM-JJTHH) et `date`: énergie de l'heure en kWh
+HOUR_COLUMNS = ["Pi", "Po", "pv"]
+
+DAY_FILE_RE = re.compile(r"^ts_summary_(\d{8})\.(?:csv|parquet)$")
+
+
+def day_sources(date, data_dir):
+    """Fichiers lus pour le bilan d'une date (chemins CSV, Parquet éventuel compris)"""
+    date_str = date.strftime("%Y%m%d")
+    return [
+        os.path.join(data_dir, f"ts_summary_{date_str}.csv"),
+        os.path.join(data_dir, f"rollup_1h_{date_str}.csv"),
+        # Sans fichier rollup, read_rollup le calcule à partir des données par seconde
+        os.path.join(data_dir, f"energie_{date_str}.bin"),
+        os.path.join(data_dir, f"energie_{date_str}.csv"),
+        os.path.join(data_dir, f"solaredge_power_{date_str}.csv"),
+        os.path.join(data_dir, f"solaredge_daily_{date_str}.csv"),
+    ]
+
+
+def _number(value):
+    """float Python, None pour NaN ou absent (stocké NULL)"""
+    if value is None or value != value:
+        return None
+    return float(value)
+
+
+def read_solar(date, data_dir):
+    """Puissances SolarEdge d'une date (colonnes Time, Production_kW), None sans fichier de puissance"""
+    df = read_day_table(os.path.join(data_dir, f"solaredge_power_{date.strftime('%Y%m%d')}.csv"))
+    if df is None or df.empty or "Time" not in df.columns or "Production_kW" not in df.columns:
+        return None
+    return df
+
+
+def pv_totals(date, data_dir, solar=None):
+    """Production PV d'une date (kWh) et puissance maximale (kW), (None, None) sans fichier SolarEdge"""
+    if solar is not None:
+        power = solar["Production_kW"]
+        # Puissances moyennes par intervalle (15 minutes chez SolarEdge): énergie = somme × durée
+        hours = 0.25
+        if len(solar) > 1:
+            hours = solar["Time"].diff().median().total_seconds() / 3600
+        return _number(power.sum() * hours), _number(power.max())
+    df = read_day_table(os.path.join(data_dir, f"solaredge_daily_{date.strftime('%Y%m%d')}.csv"))
+    if df is not None and not df.empty:
+        return (_number(df["Production_Totale_kWh"].iloc[0]) if "Production_Totale_kWh" in df.columns else None,
+                _number(df["Production_Max_kW"].iloc[0]) if "Production_Max_kW" in df.columns else None)
+    return None, None
+
+
+def hourly_energy(ts, hourly, solar):
+    """Énergie de chaque heure (kWh): moyenne horaire des puissances Pi, Po et PV.
+
+    Retourne une liste de (AAAA-MM-JJTHH, Pi, Po, pv). Les puissances viennent
+    du rollup 1h (moyennes des secondes) s'il existe, sinon des relevés 5 minutes.
+    """
+    import pandas as pd
+    columns = {}
+    if hourly is not None and not hourly.empty:
+        source = hourly.set_index("Time")
+    elif ts is not None and not ts.empty:
+        source = ts.set_index("Time")
+    else:
+        source = None
+    for name in ("Pi", "Po"):
+        if source is not None and name in source.columns:
+            columns[name] = source[name].resample("1h").mean()
+    if solar is not None:
+        columns["pv"] = solar.set_index("Time")["Production_kW"].resample("1h").mean()
+    if not columns:
+        return []
+    frame = pd.DataFrame(columns)
+    return [(time.strftime("%Y-%m-%dT%H"),) + tuple(_number(row.get(name)) for name in HOUR_COLUMNS)
+            for time, row in frame.iterrows()]
+
+
+def compute_day(date, data_dir=DATA_DIR):
+    """Calcule le bilan d'une date (dictionnaire COLUMNS) et l'énergie de chacune de ses heures.
+
+    Retourne (bilan, heures), (None, []) sans fichier ts_summary ni rollup.
+    """
+    date_str = date.strftime("%Y%m%d")
+    ts = read_day_table(os.path.join(data_dir, f"ts_summary_{date_str}.csv"))
+    hourly = read_rollup(date, "1h", data_dir)
+    if (ts is None or ts.empty) and (hourly is None or hourly.empty):
+        return None, []
+    solar = read_solar(date, data_dir)
+    row = dict.fromkeys(COLUMNS)
+    has_ts = ts is not None and not ts.empty
+    has_hourly = hourly is not None and not hourly.empty
+    for name in COUNTER_FIELDS:
+        # Index à la seconde (rollup) en priorité, sinon relevés 5 minutes; premier/dernier non nuls
+        if has_hourly and f"{name}_first" in hourly.columns:
+            first = hourly[f"{name}_first"].dropna()
+            last = hourly[f"{name}_last"].dropna()
+        elif has_ts and name in ts.columns:
+            first = last = ts[name].dropna()
+        else:
+            continue
+        if first.empty or last.empty:
+            continue
+        row[f"{name}_first"] = _number(first.iloc[0])
+        row[f"{name}_last"] = _number(last.iloc[-1])
+        row[f"{name}_delta"] = row[f"{name}_last"] - row[f"{name}_first"]
+    for name in ("Pi", "Po"):
+        peaks = []
+        if has_hourly and f"{name}_max" in hourly.columns:
+            peaks.append(hourly[f"{name}_max"].max())
+        if has_ts and name in ts.columns:
+            peaks.append(ts[name].max())
+        peaks = [peak for peak in peaks if peak == peak]
+        row[f"{name}_max"] = _number(max(peaks)) if peaks else None
+    row["samples"] = len(ts) if has_ts else 0
+    # Secondes distinctes des données par seconde (`count` du rollup est un nombre d'échantillons)
+    seconds = load_energie_frame(date, data_dir, columns=["Time"])
+    row["seconds"] = int(seconds["Time"].nunique()) if seconds is not None else 0
+    row["pv_kwh"], row["pv_max_kw"] = pv_totals(date, data_dir, solar)
+    return row, hourly_energy(ts, hourly, solar)
+
+
+class DailyStore:
+    """Base SQLite des bilans journaliers, mise à jour jour par jour selon l'empreinte des fichiers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        columns = ", ".join(f"{name} {'INTEGER' if name in ('samples', 'seconds') else 'REAL'}" for name in COLUMNS)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS days (date TEXT PRIMARY KEY, fingerprint TEXT, {columns})")
+        columns = ", ".join(f"{name} REAL" for name in HOUR_COLUMNS)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS hours (time TEXT PRIMARY KEY, date TEXT, {columns})")
+        self.db.execute("CREATE INDEX IF NOT EXISTS hours_date ON hours (date)")
+        if not self.db.execute("SELECT 1 FROM hours LIMIT 1").fetchone():
+            # Base créée avant la table des heures: tous les jours seront recalculés
+            self.db.execute("UPDATE days SET fingerprint = NULL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < DB_VERSION:
+            self.db.execute("UPDATE days SET fingerprint = NULL")
+            self.db.execute(f"PRAGMA user_version = {DB_VERSION}")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, date, data_dir=DATA_DIR, force=False):
+        """Recalcule le bilan d'une date si ses fichiers ont changé; retourne True s'il a été recalculé"""
+        key = date.strftime("%Y-%m-%d")
+        fingerprint = repr(tuple(day_file_fingerprint(path) for path in day_sources(date, data_dir)))
+        with self.lock:
+            stored = self.db.execute("SELECT fingerprint FROM days WHERE date = ?", (key,)).fetchone()
+        if stored is not None and stored[0] == fingerprint and not force:
+            return False
+        row, hours = compute_day(date, data_dir)
+        with self.lock:
+            self.db.execute("DELETE FROM hours WHERE date = ?", (key,))
+            if row is None:
+                self.db.execute("DELETE FROM days WHERE date = ?", (key,))
+            else:
+                names = ", ".join(COLUMNS)
+                marks = ", ".join("?" for _ in COLUMNS)
+                self.db.execute(f"INSERT OR REPLACE INTO days (date, fingerprint, {names}) VALUES (?, ?, {marks})",
+                                [key, fingerprint] + [row[name] for name in COLUMNS])
+                self.db.executemany(f"INSERT OR REPLACE INTO hours (time, date, {', '.join(HOUR_COLUMNS)}) "
+                                    f"VALUES (?, ?, {', '.join('?' for _ in HOUR_COLUMNS)})",
+                                    [(hour[0], key) + hour[1:] for hour in hours])
+            self.db.commit()
+        return True
+
+    def update_all(self, data_dir=DATA_DIR, force=False):
+        """Met à jour tous les jours présents dans le répertoire; retourne le nombre de jours recalculés"""
+        dates = set()
+        for name in os.listdir(data_dir):
+            match = DAY_FILE_RE.match(name)
+            if match:
+                dates.add(datetime.strptime(match.group(1), "%Y%m%d"))
+        updated = sum(self.update(date, data_dir, force) for date in sorted(dates))
+        # Jours dont les fichiers ont été supprimés
+        with self.lock:
+            stored = [row[0] for row in self.db.execute("SELECT date FROM days")]
+        for key in stored:
+            date = datetime.strptime(key, "%Y-%m-%d")
+            if date not in dates:
+                updated += self.update(date, data_dir)
+        return updated
+
+    def day(self, date):
+        """Bilan d'une date (dictionnaire), None s'il n'est pas dans la table"""
+        with self.lock:
+            row = self.db.execute("SELECT * FROM days WHERE date = ?", (date.strftime("%Y-%m-%d"),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def range(self, start, end):
+        """Bilans des dates de `start` à `end` incluses, dans l'ordre (liste de dictionnaires)"""
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM days WHERE date BETWEEN ? AND ? ORDER BY date",
+                                   (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))).fetchall()
+        return [dict(row) for row in rows]
+
+    def hours(self, start, end):
+        """Énergie heure par heure des dates de `start` à `end` incluses (liste de dictionnaires)"""
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM hours WHERE date BETWEEN ? AND ? ORDER BY time",
+                                   (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))).fetchall()
+        return [dict(row) for row in rows]
+
+    def totals(self, start, end):
+        """Bilan d'une période: énergie par index, pics, échantillons et production PV.
+
+        L'énergie d'un index est la dernière valeur de la période moins la
+        première: contrairement à la somme des différences journalières,
+        elle inclut ce qui a été compté entre deux fichiers jour.
+        """
+        rows = self.range(start, end)
+        totals = {"days": len(rows)}
+        for name in COUNTER_FIELDS:
+            first = [row[f"{name}_first"] for row in rows if row[f"{name}_first"] is not None]
+            last = [row[f"{name}_last"] for row in rows if row[f"{name}_last"] is not None]
+            totals[name] = last[-1] - first[0] if first and last else None
+        for name in ("Pi_max", "Po_max", "pv_max_kw"):
+            values = [row[name] for row in rows if row[name] is not None]
+            totals[name] = max(values) if values else None
+        for name in ("samples", "seconds", "pv_kwh"):
+            totals[name] = sum(row[name] or 0 for row in rows)
+        return totals
+
+
+def store_path(data_dir=DATA_DIR):
+    """Chemin de la base des bilans journaliers du répertoire `data_dir`"""
+    return os.path.join(data_dir, DB_DIR, DB_FILE)
+
+def open_store(data_dir=DATA_DIR):
+    """Ouvre (ou crée) la base des bilans journaliers du répertoire `data_dir` (dans DB_DIR)"""
+    os.makedirs(os.path.join(data_dir, DB_DIR), exist_ok=True)
+    return DailyStore(store_path(data_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Met à jour la table des bilans journaliers (SQLite)')
+    parser.add_argument('--data-dir', type=str, default=DATA_DIR,
+                       help=f'Répertoire des fichiers de données (défaut: {DATA_DIR})')
+    parser.add_argument('--force', action='store_true',
+                       help='Recalcule tous les jours, même ceux dont les fichiers n\'ont pas changé')
+    parser.add_argument('--from', dest='start', type=str,
+                       help='Affiche le bilan de la période à partir de cette date (AAAA-MM-JJ)')
+    parser.add_argument('--to', dest='end', type=str,
+                       help='Fin de la période affichée (AAAA-MM-JJ, défaut: aujourd\'hui)')
+    args = parser.parse_args()
+
+    store = open_store(args.data_dir)
+    updated = store.update_all(args.data_dir, args.force)
+    print(f"✅ {updated} jours recalculés ({store_path(args.data_dir)})")
+
+    if args.start:
+        try:
+            start = datetime.strptime(args.start, "%Y-%m-%d")
+            end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else datetime.now()
+        except ValueError:
+            print("❌ Dates attendues au format AAAA-MM-JJ")
+            return
+        totals = store.totals(start, end)
+        print(f"📊 Du {start:%d/%m/%Y} au {end:%d/%m/%Y}: {totals['days']} jours")
+        for name in COUNTER_FIELDS:
+            if totals[name] is not None:
+                print(f"  {name}: {totals[name]:.3f} kWh")
+        print(f"  Production PV: {totals['pv_kwh']:.3f} kWh")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Réduction du nombre de points d'une série avant affichage.
+
+Une journée par seconde compte 86 400 points par série: au-delà de quelques
+milliers de points, le navigateur ne peut de toute façon pas les distinguer.
+Deux méthodes réduisent une série (x, y) à un budget de points:
+
+- `lttb`: Largest-Triangle-Three-Buckets, garde dans chaque intervalle le
+  point qui forme le plus grand triangle avec ses voisins retenus (forme de
+  la courbe préservée);
+- `minmax`: enveloppe min/max, garde le minimum et le maximum de chaque
+  intervalle (aucun pic perdu).
+
+Les abscisses peuvent être des datetime64 ou des nombres; les points dont y
+est NaN sont ignorés.
+"""
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _clean(x, y):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    keep = ~np.isnan(y)
+    return x[keep], y[keep]
+
+
+def _numeric(x):
+    """Abscisses en float64 (secondes pour les datetime64) pour le calcul des aires."""
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[s]").astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb(x, y, points):
+    """Réduit la série (x, y) à `points` points par Largest-Triangle-Three-Buckets."""
+    x, y = _clean(x, y)
+    n = len(y)
+    if points >= n or points < 3:
+        return x, y
+    xs = _numeric(x)
+    # Premier et dernier points gardés, points - 2 intervalles entre les deux
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # Moyennes de tous les intervalles calculées en une fois; le point moyen qui suit
+    # le dernier intervalle est le dernier point de la série
+    sizes = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(xs[:n - 1], edges[:-1]) / sizes, xs[-1])[1:]
+    avg_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / sizes, y[-1])[1:]
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = xs[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[start:end] - ay) - (ax - xs[start:end]) * (avg_y[i] - ay))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def minmax(x, y, points):
+    """Réduit la série (x, y) à environ `points` points: min et max de chaque intervalle, dans l'ordre."""
+    x, y = _clean(x, y)
+    n = len(y)
+    buckets = points // 2
+    if points >= n or buckets < 1:
+        return x, y
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        low = start + int(np.argmin(y[start:end]))
+        high = start + int(np.argmax(y[start:end]))
+        selected += sorted({low, high})
+    selected = np.asarray(selected, dtype=np.int64)
+    return x[selected], y[selected]
+
+
+def downsample(x, y, points, method="lttb"):
+    """Réduit la série (x, y) à `points` points avec la méthode `method` ("lttb" ou "minmax")."""
+    if method == "minmax":
+        return minmax(x, y, points)
+    return lttb(x, y, points)
@@ -0,0 +1,160 @@
+"""
+Compteurs et histogrammes de l'ingestion MQTT (mqttToCsv.py).
+
+Les métriques sont des compteurs entiers et des histogrammes à classes
+fixes: une mesure coûte une addition (et une recherche dichotomique pour
+un histogramme), sans allocation. Elles sont exposées au format texte
+Prometheus sur un petit serveur HTTP local (`/metrics`) et/ou réécrites
+périodiquement dans un fichier JSON.
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Counter:
+    """Compteur croissant, éventuellement décliné selon un label (ex. le sujet MQTT)."""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.value = 0
+        self.values = {}
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def inc_label(self, key, amount=1):
+        values = self.values
+        values[key] = values.get(key, 0) + amount
+
+    def samples(self):
+        if self.label is None:
+            return [("", self.value)]
+        return [(f'{{{self.label}="{key}"}}', value) for key, value in sorted(self.values.items())]
+
+    def snapshot(self):
+        return self.value if self.label is None else dict(self.values)
+
+
+class Gauge:
+    """Valeur calculée au moment de la lecture par la fonction `func`."""
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        return [("", self.func())]
+
+    def snapshot(self):
+        return self.func()
+
+
+class Histogram:
+    """Histogramme à classes fixes (bornes supérieures `buckets`, triées)."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((f'_bucket{{le="{bound:g}"}}', cumulative))
+        samples.append(('_bucket{le="+Inf"}', self.count))
+        samples.append(("_sum", self.sum))
+        samples.append(("_count", self.count))
+        return samples
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([f"{bound:g}" for bound in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class Registry:
+    """Ensemble des métriques d'un processus."""
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _register(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self._register(Counter(name, help, label))
+
+    def gauge(self, name, help, func):
+        return self._register(Gauge(name, help, func))
+
+    def histogram(self, name, help, buckets):
+        return self._register(Histogram(name, help, buckets))
+
+    def render(self):
+        """Retourne toutes les métriques au format texte Prometheus."""
+        kinds = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kinds[type(metric)]}")
+            for suffix, value in metric.samples():
+                lines.append(f"{metric.name}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Retourne toutes les métriques dans un dictionnaire sérialisable en JSON."""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+def serve(registry, port, host="127.0.0.1"):
+    """Démarre un serveur HTTP local qui expose `registry` sur /metrics (thread démon)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_stats_file(registry, path):
+    """Réécrit atomiquement le fichier de statistiques JSON `path`."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(registry.snapshot(), file, indent=1)
+    os.replace(tmp_path, path)
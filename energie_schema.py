@@ -0,0 +1,95 @@
+"""
+Schéma des champs du compteur Tasmota SML et décodage des messages MQTT.
+
+Un seul schéma (FIELDS) définit l'ordre des valeurs décodées et les en-têtes
+des fichiers CSV écrits par mqttToCsv.py. SCHEMA_VERSION change à chaque
+modification de FIELDS; les champs inconnus d'un message ne sont jamais
+mélangés aux colonnes du schéma, ils sont retournés à part (Sample.extra).
+"""
+
+import json
+import math
+from collections import namedtuple
+
+# Backend JSON le plus rapide disponible
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        json_loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        json_loads = json.loads
+        JSON_BACKEND = "json"
+
+# Version du schéma des colonnes, à incrémenter à chaque modification de FIELDS
+SCHEMA_VERSION = 1
+
+# Champs mesurés par le compteur (ordre des colonnes dans les fichiers CSV)
+FIELDS = (
+    "Pi", "Po",
+    "B1", "B2", "E1", "E2",
+    "P1i", "P2i", "P3i", "P1o", "P2o", "P3o",
+    "I1", "I2", "I3", "U1", "U2", "U3"
+)
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+# Attributs connus hors mesures (résumé TS)
+META_KEYS = frozenset(("TS", "NS"))
+
+# En-têtes des fichiers CSV
+TS_HEADERS = ["Time", "TS", "NS"] + list(FIELDS)
+AGGREGATE_HEADERS = ["Time"] + list(FIELDS) + [
+    "count"  # Nombre de mesures dans cette seconde
+]
+# Colonnes min/max optionnelles du fichier energie
+MINMAX_HEADERS = [f"{name}_{stat}" for name in FIELDS for stat in ("min", "max")]
+
+# Agrégats à résolution réduite (pyramide) construits par mqttToCsv: niveau -> durée en secondes
+ROLLUP_LEVELS = {"10s": 10, "1min": 60, "15min": 900, "1h": 3600}
+# Index d'énergie cumulés, dont on garde la première et la dernière valeur de chaque intervalle
+COUNTER_FIELDS = ("B1", "B2", "E1", "E2")
+COUNTER_HEADERS = [f"{name}_{stat}" for name in COUNTER_FIELDS for stat in ("first", "last")]
+# Time est le début de l'intervalle, les champs sont les moyennes, count le nombre d'échantillons
+ROLLUP_HEADERS = ["Time"] + list(FIELDS) + MINMAX_HEADERS + COUNTER_HEADERS + ["count"]
+
+# En-têtes du fichier des champs inconnus (option --schema-policy evolve), un champ par ligne
+EXTRA_HEADERS = ["Time", "field", "value"]
+
+# Message décodé: `values` contient une valeur par champ de FIELDS, NaN si absente.
+# `ts` et `ns` ne sont renseignés que pour les résumés TS (toutes les 5 minutes).
+# `extra` contient les attributs hors schéma ({nom: valeur}), None s'il n'y en a pas.
+Sample = namedtuple("Sample", ["time", "ts", "ns", "values", "extra"])
+
+_EMPTY_ROW = [math.nan] * len(FIELDS)
+
+
+def decode_payload(payload):
+    """Décode un message Tasmota `{"Time": ..., "z": {...}}` en Sample.
+
+    Lève ValueError (ou TypeError) si le message n'a pas la forme attendue.
+    """
+    data = json_loads(payload)
+    if type(data) is not dict:
+        raise ValueError("le message n'est pas un objet JSON")
+    z_data = data.get("z")
+    if type(z_data) is not dict:
+        raise ValueError("attribut 'z' absent ou invalide")
+    time_str = data.get("Time")
+    if type(time_str) is not str:
+        raise ValueError("attribut 'Time' absent ou invalide")
+
+    values = _EMPTY_ROW.copy()
+    extra = None
+    get_index = FIELD_INDEX.get
+    for key, value in z_data.items():
+        index = get_index(key)
+        if index is not None:
+            values[index] = float(value)
+        elif key not in META_KEYS:
+            if extra is None:
+                extra = {}
+            extra[key] = value
+    return Sample(time_str, z_data.get("TS"), z_data.get("NS"), values, extra)
@@ -0,0 +1,389 @@
+"""
+Formats de stockage des données du compteur, partagés entre mqttToCsv.py et
+les dashboards.
+
+Fichier binaire jour `energie_AAAAMMJJ.bin`: un en-tête de HEADER_SIZE octets
+(signature, nombre de champs, taille d'un enregistrement, noms des champs
+séparés par des virgules) suivi d'enregistrements de taille fixe:
+`Time` (int64, secondes depuis 1970 de l'heure locale du compteur), une
+valeur float32 par champ (NaN si absente) et `count` (uint32). Le fichier
+est projeté en mémoire par `read_day_binary` sans copie ni parsing.
+
+Fichiers `rollup_<niveau>_AAAAMMJJ.csv`: pyramide d'agrégats (10s, 1min,
+15min, 1h) écrite par mqttToCsv, lue par `read_rollup`.
+"""
+
+import glob
+import io
+import os
+import struct
+from datetime import datetime
+
+BINARY_MAGIC = b"ENRGBIN1"
+HEADER_SIZE = 256
+_HEADER = struct.Struct("<8sHH")
+_EPOCH = datetime(1970, 1, 1)
+
+
+def record_struct(fields):
+    """Structure d'un enregistrement binaire pour la liste de champs `fields`."""
+    return struct.Struct(f"<q{len(fields)}fI")
+
+
+def binary_header(fields):
+    """En-tête du fichier binaire pour la liste de champs `fields`."""
+    names = ",".join(fields).encode("ascii")
+    header = _HEADER.pack(BINARY_MAGIC, len(fields), record_struct(fields).size) + names
+    if len(header) > HEADER_SIZE:
+        raise ValueError("trop de champs pour l'en-tête du fichier binaire")
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def parse_binary_header(header):
+    """Retourne la liste des champs d'un en-tête de fichier binaire."""
+    magic, nfields, record_size = _HEADER.unpack_from(header)
+    if magic != BINARY_MAGIC:
+        raise ValueError("signature de fichier binaire invalide")
+    names = header[_HEADER.size:].rstrip(b"\0").decode("ascii")
+    fields = names.split(",") if names else []
+    if len(fields) != nfields or record_struct(fields).size != record_size:
+        raise ValueError("en-tête de fichier binaire incohérent")
+    return fields
+
+
+def epoch_seconds(time_str):
+    """Secondes depuis 1970 de l'heure locale `time_str` ("2026-01-14T10:09:41" ou "2026-01-14 10:09:41")."""
+    return int((datetime.fromisoformat(time_str) - _EPOCH).total_seconds())
+
+
+def binary_dtype(fields):
+    """dtype NumPy d'un enregistrement binaire (Time est lu directement en datetime64[s])."""
+    import numpy as np
+    return np.dtype([("Time", "<M8[s]")] + [(name, "<f4") for name in fields] + [("count", "<u4")])
+
+
+def read_day_binary(path):
+    """Projette un fichier binaire jour en mémoire.
+
+    Retourne un tableau structuré NumPy (colonnes Time, champs, count) adossé
+    au fichier: aucune copie, chaque colonne est une vue. Un dernier
+    enregistrement incomplet (écriture en cours) est ignoré.
+    """
+    import numpy as np
+    with open(path, "rb") as file:
+        fields = parse_binary_header(file.read(HEADER_SIZE))
+    dtype = binary_dtype(fields)
+    count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def day_segments(path):
+    """Fichier jour `path` et ses segments `<nom>.v<n>.<ext>` existants, par version.
+
+    mqttToCsv écrit dans un segment `.v<n>` quand les colonnes d'un fichier
+    jour changent (CsvDayWriter._select_path, fichiers CSV et binaires):
+    toutes les secondes du jour sont réparties dans ces fichiers.
+    """
+    base, ext = os.path.splitext(path)
+    versions = []
+    for segment in glob.glob(glob.escape(base) + ".v*" + ext):
+        version = segment[len(base) + 2:len(segment) - len(ext)]
+        if version.isdigit():
+            versions.append((int(version), segment))
+    return ([path] if os.path.exists(path) else []) + [segment for _, segment in sorted(versions)]
+
+
+def _parquet_current(csv_path, parquet_path):
+    """True si le Parquet compacté existe et n'est pas plus ancien que le CSV
+    (un CSV modifié après la compaction, par exemple par une resynchronisation,
+    est lu à la place du Parquet)."""
+    try:
+        parquet_mtime = os.path.getmtime(parquet_path)
+    except OSError:
+        return False
+    try:
+        return parquet_mtime >= os.path.getmtime(csv_path)
+    except OSError:
+        return True  # CSV supprimé après la compaction
+
+
+def read_day_table(csv_path, columns=None):
+    """Lit un fichier jour: le Parquet compacté (même nom, extension .parquet)
+    s'il existe et qu'il est à jour, sinon le CSV.
+
+    Les segments `<nom>.v<n>.csv` écrits par mqttToCsv après un changement de
+    colonnes sont ajoutés à la suite (colonnes absentes à NaN). Seules les
+    colonnes `columns` sont lues si elles sont données. Les colonnes Time et
+    Date sont converties en datetime. Retourne None si aucun fichier n'existe.
+    """
+    import pandas as pd
+    base = os.path.splitext(csv_path)[0]
+    frames = []
+    parquet_path = base + ".parquet"
+    if _parquet_current(csv_path, parquet_path):
+        try:
+            frames.append(pd.read_parquet(parquet_path, columns=columns))
+        except ImportError:
+            pass  # pyarrow absent: lire le CSV
+    for path in day_segments(csv_path):
+        if path != csv_path or not frames:
+            frames.append(_read_csv(path, columns))
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def day_file_fingerprint(csv_path):
+    """Empreinte des fichiers lus par `read_day_table` pour `csv_path`.
+
+    Tuple de (nom, mtime en ns, taille) du Parquet, du fichier et de ses
+    segments existants (`csv_path` peut aussi être un fichier binaire): elle
+    change dès qu'un de ces fichiers est modifié. Tuple vide si aucun
+    fichier n'existe.
+    """
+    base = os.path.splitext(csv_path)[0]
+    fingerprint = []
+    for path in [base + ".parquet"] + day_segments(csv_path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def _read_csv(path, columns):
+    import pandas as pd
+    usecols = None if columns is None else (lambda column: column in columns)
+    df = pd.read_csv(path, usecols=usecols)
+    for column in ("Time", "Date"):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], format="ISO8601")
+    return df
+
+
+# Lignes complètes déjà comptées par fichier CSV: chemin -> (inode, taille, lignes)
+_csv_rows = {}
+
+
+def count_csv_rows(path):
+    """Nombre de lignes de données complètes d'un fichier CSV (en-tête exclu).
+
+    Le fichier n'est relu qu'à partir de la taille du comptage précédent
+    tant qu'il ne fait que grandir.
+    """
+    stat = os.stat(path)
+    inode, size, lines = _csv_rows.get(path, (None, 0, 0))
+    if inode != stat.st_ino or stat.st_size < size:
+        size, lines = 0, 0
+    with open(path, "rb") as file:
+        file.seek(size)
+        data = file.read()
+    # Seules les lignes terminées sont comptées, la dernière peut être en cours d'écriture
+    complete = data.rfind(b"\n") + 1
+    lines += data.count(b"\n", 0, complete)
+    _csv_rows[path] = (stat.st_ino, size + complete, lines)
+    return max(0, lines - 1)
+
+
+def day_table_rows(csv_path):
+    """Nombre de lignes lues par `read_day_table` pour `csv_path` (0 si aucun fichier)."""
+    base = os.path.splitext(csv_path)[0]
+    rows = None
+    parquet_path = base + ".parquet"
+    if _parquet_current(csv_path, parquet_path):
+        try:
+            import pyarrow.parquet as pq
+            rows = pq.ParquetFile(parquet_path).metadata.num_rows
+        except ImportError:
+            pass
+    for path in day_segments(csv_path):
+        if path != csv_path or rows is None:
+            rows = (rows or 0) + count_csv_rows(path)
+    return rows or 0
+
+
+def read_energie_binary(date_str, data_dir="data/"):
+    """Projette le fichier binaire jour `energie_AAAAMMJJ.bin` et ses segments
+    `.v<n>.bin` s'ils sont complets.
+
+    Retourne la liste des tableaux des segments (voir `read_day_binary`).
+    Le fichier binaire peut avoir perdu ses dernières lignes lors d'un arrêt
+    brutal alors que le CSV les contient: il n'est utilisé que s'il a au moins
+    autant de lignes que le CSV (ou le Parquet) et ses segments. Retourne
+    None sinon.
+    """
+    paths = day_segments(os.path.join(data_dir, f"energie_{date_str}.bin"))
+    if not paths:
+        return None
+    segments = [read_day_binary(path) for path in paths]
+    if sum(len(data) for data in segments) < day_table_rows(os.path.join(data_dir, f"energie_{date_str}.csv")):
+        return None
+    return segments
+
+
+def binary_frame(segments, after=0, columns=None):
+    """DataFrame des lignes des segments binaires à partir de la ligne `after`.
+
+    Seules les colonnes `columns` sont copiées si elles sont données (colonnes
+    absentes d'un segment à NaN).
+    """
+    import pandas as pd
+    frames = []
+    for data in segments:
+        if after < len(data):
+            names = [name for name in data.dtype.names if columns is None or name in columns]
+            frames.append(pd.DataFrame({name: data[name][after:] for name in names}))
+        after = max(0, after - len(data))
+    if not frames:
+        data = segments[-1]
+        return pd.DataFrame({name: data[name][:0] for name in data.dtype.names
+                             if columns is None or name in columns})
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_energie_frame(date, data_dir="data/", columns=None):
+    """Charge les données par seconde d'une date en DataFrame.
+
+    Le fichier binaire `energie_AAAAMMJJ.bin` (et ses segments) est utilisé
+    s'il existe et qu'il est complet, sinon le Parquet compacté ou le CSV
+    `energie_AAAAMMJJ.csv`. Seules les colonnes `columns` sont chargées si
+    elles sont données. Retourne None si aucun n'existe.
+    """
+    date_str = date.strftime("%Y%m%d")
+    segments = read_energie_binary(date_str, data_dir)
+    if segments is not None:
+        return binary_frame(segments, columns=columns)
+    return read_day_table(os.path.join(data_dir, f"energie_{date_str}.csv"), columns)
+
+
+def merge_rollup_rows(df):
+    """Fusionne les lignes partielles d'un même intervalle d'un fichier rollup.
+
+    Les moyennes sont pondérées par `count`, min/max/first/last combinés.
+    """
+    if not df["Time"].duplicated().any():
+        return df
+    import pandas as pd
+    from energie_schema import FIELDS, COUNTER_FIELDS
+    groups = df.groupby("Time", sort=True)
+    merged = {"count": groups["count"].sum()}
+    for name in FIELDS:
+        weights = df["count"].where(df[name].notna(), 0)
+        total = weights.groupby(df["Time"]).sum()
+        merged[name] = (df[name].fillna(0) * weights).groupby(df["Time"]).sum() / total.where(total > 0)
+        merged[f"{name}_min"] = groups[f"{name}_min"].min()
+        merged[f"{name}_max"] = groups[f"{name}_max"].max()
+    # Index croissants: la première valeur est la plus petite, la dernière la plus grande
+    for name in COUNTER_FIELDS:
+        merged[f"{name}_first"] = groups[f"{name}_first"].min()
+        merged[f"{name}_last"] = groups[f"{name}_last"].max()
+    result = pd.DataFrame(merged).reset_index()
+    return result[list(df.columns)]
+
+
+def rollup_frame(df, level):
+    """Calcule un niveau de la pyramide (colonnes ROLLUP_HEADERS) à partir des données par seconde."""
+    import pandas as pd
+    from energie_schema import FIELDS, COUNTER_FIELDS, ROLLUP_HEADERS, ROLLUP_LEVELS
+    groups = df.set_index("Time").resample(f"{ROLLUP_LEVELS[level]}s")
+    columns = {name: groups[name].mean() for name in FIELDS}
+    for name in FIELDS:
+        columns[f"{name}_min"] = groups[name].min()
+        columns[f"{name}_max"] = groups[name].max()
+    for name in COUNTER_FIELDS:
+        columns[f"{name}_first"] = groups[name].first()
+        columns[f"{name}_last"] = groups[name].last()
+    columns["count"] = groups["count"].sum()
+    result = pd.DataFrame(columns).reset_index()
+    return result[result["count"] > 0][ROLLUP_HEADERS].reset_index(drop=True)
+
+
+def read_rollup(date, level, data_dir="data/"):
+    """Charge un niveau de la pyramide d'agrégats ("10s", "1min", "15min", "1h") d'une date.
+
+    Lit le fichier `rollup_<niveau>_AAAAMMJJ.csv` écrit par mqttToCsv (ou son
+    Parquet compacté). Les intervalles absents du fichier ou dont `count`
+    diffère de la somme des `count` des données par seconde (intervalle
+    encore ouvert, ou perdu en mémoire lors d'un arrêt brutal de mqttToCsv)
+    sont recalculés à partir des données par seconde. Retourne None si
+    aucune donnée n'existe pour cette date.
+    """
+    import pandas as pd
+    from energie_schema import ROLLUP_LEVELS
+    date_str = date.strftime("%Y%m%d")
+    df = read_day_table(os.path.join(data_dir, f"rollup_{level}_{date_str}.csv"))
+    if df is not None:
+        df = merge_rollup_rows(df)
+    counts = load_energie_frame(date, data_dir, columns=["Time", "count"])
+    if counts is None or counts.empty:
+        return df
+    if df is None:
+        return rollup_frame(load_energie_frame(date, data_dir), level)
+    # Comparer intervalle par intervalle le nombre d'échantillons du fichier et des secondes
+    interval = f"{ROLLUP_LEVELS[level]}s"
+    starts = counts["Time"].astype("datetime64[ns]").dt.floor(interval)
+    expected = counts["count"].groupby(starts).sum()
+    written = df.set_index(df["Time"].astype("datetime64[ns]"))["count"]
+    stale = expected.index[expected.ne(written.reindex(expected.index))]
+    if not len(stale):
+        return df
+    seconds = load_energie_frame(date, data_dir)
+    seconds = seconds[seconds["Time"].astype("datetime64[ns]").dt.floor(interval).isin(stale)]
+    fixed = rollup_frame(seconds, level)
+    kept = df[~df["Time"].astype("datetime64[ns]").isin(stale)]
+    return pd.concat([kept, fixed], ignore_index=True).sort_values("Time", ignore_index=True)
+
+
+class CsvTail:
+    """Lecture incrémentale d'un fichier CSV qui grandit (fichier du jour).
+
+    Garde la position de lecture et le DataFrame déjà lu: chaque appel à
+    `read` ne lit que les lignes complètes ajoutées depuis l'appel
+    précédent (une dernière ligne en cours d'écriture est lue au suivant).
+    Si le fichier est remplacé ou raccourci, il est relu depuis le début.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frame = None
+        self.header = b""
+        self.offset = 0
+        self.inode = None
+
+    def read(self):
+        """Lit les nouvelles lignes complètes et retourne le DataFrame des lignes ajoutées (None si aucune)."""
+        import pandas as pd
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.frame, self.header, self.offset, self.inode = None, b"", 0, stat.st_ino
+        if stat.st_size == self.offset:
+            return None
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read(stat.st_size - self.offset)
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return None
+        data = data[:end]
+        self.offset += end
+        if not self.header:
+            line_end = data.index(b"\n") + 1
+            self.header, data = data[:line_end], data[line_end:]
+            if not data:
+                return None
+        rows = pd.read_csv(io.BytesIO(self.header + data))
+        for column in ("Time", "Date"):
+            if column in rows.columns:
+                rows[column] = pd.to_datetime(rows[column], format="ISO8601")
+        self.frame = rows if self.frame is None else pd.concat([self.frame, rows], ignore_index=True)
+        return rows
@@ -1,182 +1,1202 @@
-import json
 import csv
 import paho.mqtt.client as mqtt
-from datetime import datetime
-from collections import defaultdict
+from datetime import datetime, timedelta
 import threading
 import logging
 import time
 import sys
 import argparse
 import signal
+import os
+import math
+import glob
+import re
+import struct
+import zlib
+from array import array
+from collections import deque
+
+from energie_schema import (
+    FIELDS, TS_HEADERS, AGGREGATE_HEADERS, MINMAX_HEADERS, JSON_BACKEND, decode_payload,
+    ROLLUP_LEVELS, ROLLUP_HEADERS, COUNTER_FIELDS, EXTRA_HEADERS, SCHEMA_VERSION
+)
+from energie_store import (
+    HEADER_SIZE, binary_header, day_segments, epoch_seconds, parse_binary_header, record_struct
+)
+from energie_metrics import Registry, serve as serve_metrics, write_stats_file
 
 
 # Configuration MQTT
 MQTT_BROKER = "broker.emqx.io"
 MQTT_PORT = 1883
-MQTT_TOPIC = "tele/tasmota_EB7D9F/SENSOR"
+MQTT_TOPICS = ["tele/tasmota_EB7D9F/SENSOR"]  # sujets ou jokers MQTT (+, #), un compteur par sujet
 MQTT_CLIENT = "tasmota_EB7D9F"
 MQTT_USER = "DVES_USER"
 MQTT_PASSWORD = ""
 MQTT_TIMEOUT = 10
 
-# Fichiers de sortie
-DATE = datetime.now().strftime('%Y%m%d')
+# Fichiers de sortie, un fichier par jour selon le champ Time des messages
+# Le compteur principal écrit dans DATA_DIR, les autres dans DATA_DIR/<compteur>
 DATA_DIR = "/home/pi/data"
-TS_CSV_FILE = f"{DATA_DIR}/ts_summary_{DATE}.csv"  # Pour les résumés TS toutes les 5 minutes
-AGGREGATE_CSV_FILE = f"{DATA_DIR}/energie_{DATE}.csv"  # Pour les données agrégées par seconde
+PRIMARY_DEVICE = "tasmota_EB7D9F"
+DEVICE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")  # noms de compteurs acceptés (noms de répertoires)
+MAX_DEVICES = 16  # au-delà, les messages des nouveaux compteurs sont ignorés
+TS_CSV_FILE = "ts_summary_{date}.csv"  # Pour les résumés TS toutes les 5 minutes
+AGGREGATE_CSV_FILE = "energie_{date}.csv"  # Pour les données agrégées par seconde
+AGGREGATE_BIN_FILE = "energie_{date}.bin"  # Mêmes données, format binaire à taille fixe
+BINARY = True  # écrire aussi le fichier binaire jour
+ROLLUP_CSV_FILE = "rollup_{level}_{date}.csv"  # Agrégats 10s, 1min, 15min et 1h
+ROLLUP = True  # construire les agrégats à résolution réduite
+EXTRA_CSV_FILE = "energie_extra_{date}.csv"  # Champs hors schéma (--schema-policy evolve)
+# Champs inconnus des messages: "project" les ignore (en les comptant), "evolve" les écrit aussi
+# dans EXTRA_CSV_FILE, une ligne par valeur
+SCHEMA_POLICY = "project"
+ROTATION_GRACE = 120  # secondes d'inactivité avant de fermer les fichiers d'un jour passé
 # flag pour plus de sorties à la console
 VERBOSE = False
 
-# Structure pour agréger les données par seconde
-aggregation = defaultdict(list)
+# Politique d'écriture des fichiers CSV (les fichiers restent ouverts toute la journée)
+FLUSH_ROWS = 120       # flush après N lignes écrites
+FLUSH_INTERVAL = 60    # flush au plus tard après T secondes
+FSYNC = True           # fsync après chaque flush (données réellement sur la carte SD)
+WRITE_BUFFER = 64 * 1024  # taille du tampon d'écriture en octets
+
+# Journal d'écriture anticipée (spool) des échantillons pas encore écrits dans les CSV
+SPOOL = True
+SPOOL_DIR = ".spool"     # sous-répertoire de DATA_DIR
+SPOOL_FSYNC = 1.0        # fsync du spool au plus toutes les T secondes (0 = à chaque échantillon)
+
+# Colonnes min/max optionnelles du fichier energie (option --minmax)
+MINMAX = False
+MEAN_DECIMALS = 4  # arrondi des moyennes écrites
+
+# Secondes les plus récentes gardées dans le tampon d'agrégation à chaque écriture:
+# une seconde encore en cours de réception n'est pas coupée en deux lignes
+AGGREGATION_HOLD = 1
+
+# File entre le thread réseau MQTT et le thread d'ingestion (agrégation, écriture des résumés TS)
+QUEUE_SIZE = 10000       # nombre maximal de messages décodés en mémoire
+QUEUE_POLICY = "block"   # si la file est pleine: block, drop-oldest ou spill (débordement sur disque)
+QUEUE_BATCH = 500        # messages traités par lot par le thread d'ingestion
+QUEUE_SPILL_FILE = "queue_spill.bin"  # dans DATA_DIR/SPOOL_DIR
+
+# Métriques: serveur HTTP local /metrics (0 = désactivé) et fichier de statistiques JSON
+METRICS_PORT = 0
+STATS_FILE = None
 
 # Flag pour signaler l'arrêt du programme
 stop_program = False
 
+# Nombre de messages invalides ignorés
+malformed_payloads = 0
+
+# File des messages décodés (créée par start_ingest)
+sample_queue = None
+
+# Métriques de l'ingestion (voir energie_metrics)
+METRICS = Registry("mqtttocsv_")
+MESSAGES = METRICS.counter("messages_total", "Messages MQTT reçus par sujet", label="topic")
+MALFORMED = METRICS.gauge("malformed_payloads", "Messages invalides ignorés",
+                          lambda: malformed_payloads)
+DECODE_SECONDS = METRICS.histogram("decode_seconds", "Durée du décodage d'un message",
+                                   (5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 1e-2))
+WINDOW_SAMPLES = METRICS.histogram("window_samples", "Échantillons par fenêtre d'agrégation écrite",
+                                   (10, 100, 500, 1000, 2000, 5000, 10000, 50000))
+PENDING_SAMPLES = METRICS.gauge("pending_samples", "Échantillons en attente d'écriture",
+                                lambda: sum(d.aggregation.samples for d in list(devices.values())))
+FLUSH_SECONDS = METRICS.histogram("flush_seconds", "Durée d'un flush (et fsync) de fichier",
+                                  (1e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0))
+ROWS_WRITTEN = METRICS.counter("rows_written_total", "Lignes écrites par type de fichier", label="kind")
+BYTES_WRITTEN = METRICS.counter("bytes_written_total", "Octets écrits par type de fichier", label="kind")
+OPEN_FILES = METRICS.gauge("open_files", "Fichiers de sortie ouverts", lambda: len(writers))
+CONNECTS = METRICS.counter("connects_total", "Connexions au broker MQTT")
+DISCONNECTS = METRICS.counter("disconnects_total", "Déconnexions du broker MQTT")
+UNKNOWN_FIELDS = METRICS.counter("unknown_fields_total", "Valeurs de champs hors schéma reçues", label="field")
+QUEUE_DEPTH = METRICS.gauge("queue_depth", "Messages en attente dans la file d'ingestion (mémoire et disque)",
+                            lambda: len(sample_queue) if sample_queue is not None else 0)
+QUEUE_DROPPED = METRICS.counter("queue_dropped_total", "Messages perdus par la file pleine (drop-oldest)")
+QUEUE_SPILLED = METRICS.counter("queue_spilled_total", "Messages débordés sur disque par la file pleine (spill)")
+QUEUE_BATCHES = METRICS.histogram("queue_batch_size", "Messages par lot traité par le thread d'ingestion",
+                                  (1, 10, 50, 100, 200, 500, 1000))
+
+
+class SecondStats:
+    """Accumulateur en flux pour une seconde.
+
+    Somme, minimum, maximum et nombre d'échantillons de chaque champ sont
+    conservés dans des tableaux de taille fixe (un élément par champ de
+    FIELDS): la mémoire ne dépend pas du nombre d'échantillons reçus.
+    """
+
+    __slots__ = ("sum", "min", "max", "count", "samples")
+
+    _ZEROS = array('d', [0.0] * len(FIELDS))
+    _POS_INF = array('d', [math.inf] * len(FIELDS))
+    _NEG_INF = array('d', [-math.inf] * len(FIELDS))
+    _COUNTS = array('I', [0] * len(FIELDS))
+
+    def __init__(self):
+        self.sum = array('d', self._ZEROS)
+        self.min = array('d', self._POS_INF)
+        self.max = array('d', self._NEG_INF)
+        self.count = array('I', self._COUNTS)
+        self.samples = 0
+
+    def add(self, index, value):
+        """Ajoute la valeur `value` au champ d'indice `index`."""
+        self.sum[index] += value
+        if value < self.min[index]:
+            self.min[index] = value
+        if value > self.max[index]:
+            self.max[index] = value
+        self.count[index] += 1
+
+    def means(self):
+        """Retourne les moyennes dans l'ordre de FIELDS, NaN si aucun échantillon."""
+        return [self.sum[i] / n if n else math.nan for i, n in enumerate(self.count)]
+
+    def row(self, minmax=False):
+        """Retourne les moyennes (et min/max) dans l'ordre de FIELDS, vide si aucun échantillon."""
+        means = []
+        extremes = []
+        for i in range(len(FIELDS)):
+            n = self.count[i]
+            if n:
+                means.append(round(self.sum[i] / n, MEAN_DECIMALS))
+                if minmax:
+                    extremes += [self.min[i], self.max[i]]
+            else:
+                means.append('')
+                if minmax:
+                    extremes += ['', '']
+        return means, extremes
+
+
+class RollupBucket(SecondStats):
+    """Accumulateur d'un intervalle de la pyramide d'agrégats (10 s à 1 h).
+
+    Fusionne les SecondStats des secondes de l'intervalle, et garde la
+    première et la dernière valeur des index d'énergie (COUNTER_FIELDS).
+    """
+
+    __slots__ = ("first", "last", "first_time", "last_time")
+
+    COUNTER_INDEXES = [FIELDS.index(name) for name in COUNTER_FIELDS]
+
+    def __init__(self):
+        super().__init__()
+        self.first = [math.nan] * len(COUNTER_FIELDS)
+        self.last = [math.nan] * len(COUNTER_FIELDS)
+        self.first_time = [math.inf] * len(COUNTER_FIELDS)
+        self.last_time = [-math.inf] * len(COUNTER_FIELDS)
+
+    def merge(self, epoch, stats):
+        """Ajoute les statistiques `stats` de la seconde `epoch`."""
+        for i, n in enumerate(stats.count):
+            if n:
+                self.sum[i] += stats.sum[i]
+                if stats.min[i] < self.min[i]:
+                    self.min[i] = stats.min[i]
+                if stats.max[i] > self.max[i]:
+                    self.max[i] = stats.max[i]
+                self.count[i] += n
+        self.samples += stats.samples
+        # Les index sont croissants: min et max de la seconde sont ses première et dernière valeurs
+        for j, i in enumerate(self.COUNTER_INDEXES):
+            if stats.count[i]:
+                if epoch < self.first_time[j]:
+                    self.first[j] = stats.min[i]
+                    self.first_time[j] = epoch
+                if epoch > self.last_time[j]:
+                    self.last[j] = stats.max[i]
+                    self.last_time[j] = epoch
+
+    def row(self, time_value):
+        """Retourne la ligne du fichier rollup (colonnes ROLLUP_HEADERS)."""
+        means, extremes = super().row(minmax=True)
+        counters = []
+        for first, last in zip(self.first, self.last):
+            counters += ['' if first != first else first, '' if last != last else last]
+        return [time_value] + means + extremes + counters + [self.samples]
+
+
+class Rollups:
+    """Pyramide d'agrégats d'un compteur, mise à jour à chaque fenêtre écrite.
+
+    Les intervalles ouverts restent en mémoire (au plus deux par niveau) et
+    sont écrits quand une seconde postérieure à leur fin a été vue. Une
+    seconde en retard sur un intervalle déjà écrit produit une deuxième
+    ligne partielle pour le même intervalle, fusionnée à la lecture par
+    energie_store.read_rollup. Les intervalles ouverts perdus lors d'un arrêt
+    brutal sont recalculés par read_rollup à partir des données par seconde.
+    """
+
+    _EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, levels=None):
+        self.levels = ROLLUP_LEVELS if levels is None else levels
+        self.buckets = {level: {} for level in self.levels}
+        self.watermark = -math.inf
+
+    def add(self, time_key, stats):
+        """Ajoute les statistiques d'une seconde à tous les niveaux."""
+        epoch = epoch_seconds(time_key)
+        for level, seconds in self.levels.items():
+            buckets = self.buckets[level]
+            start = epoch - epoch % seconds
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = RollupBucket()
+            bucket.merge(epoch, stats)
+        if epoch > self.watermark:
+            self.watermark = epoch
+
+    def closed(self, final=False):
+        """Retire et retourne les intervalles terminés (tous avec `final`): [(niveau, jour, ligne)]."""
+        rows = []
+        for level, seconds in self.levels.items():
+            buckets = self.buckets[level]
+            for start in sorted(buckets):
+                if not final and start + seconds > self.watermark:
+                    break
+                begin = self._EPOCH + timedelta(seconds=start)
+                rows.append((level, begin.strftime('%Y%m%d'),
+                             buckets.pop(start).row(begin.strftime('%Y-%m-%d %H:%M:%S'))))
+        return rows
+
+
+class Spool:
+    """Journal d'écriture anticipée des échantillons agrégés.
+
+    Chaque échantillon est ajouté à la fin du segment courant sous la forme
+    d'un enregistrement préfixé par sa longueur et son CRC32:
+    `<longueur:u16><crc32:u32>` puis le corps `<len(Time):u8><Time><(index:u8, valeur:f64)...>`.
+    Le segment est changé à chaque échange du tampon d'agrégation et supprimé
+    quand les secondes correspondantes sont écrites sur le disque. Les
+    segments trouvés au démarrage sont rejoués dans les fichiers du jour.
+    """
+
+    HEADER = struct.Struct('<HI')
+    PAIR = struct.Struct('<Bd')
+
+    def __init__(self, directory, fsync_interval=None):
+        self.directory = directory
+        self.fsync_interval = SPOOL_FSYNC if fsync_interval is None else fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        # Segments laissés par une exécution précédente, à rejouer
+        self.recovered = sorted(glob.glob(os.path.join(directory, "spool_*.wal")))
+        self.seq = int(os.path.basename(self.recovered[-1])[6:-4]) if self.recovered else 0
+        self.file = None
+        self.path = None
+        self.last_sync = time.monotonic()
+        self.records = 0
+        self.bytes_written = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        self.seq += 1
+        self.path = os.path.join(self.directory, f"spool_{self.seq:08d}.wal")
+        # Sans tampon: chaque enregistrement survit à un arrêt brutal du processus
+        self.file = open(self.path, 'ab', buffering=0)
+
+    def append(self, time_str, values):
+        """Ajoute un échantillon au segment courant (appelé sous le verrou de l'agrégation)."""
+        time_bytes = time_str.encode('ascii', 'replace')[:255]
+        body = bytes((len(time_bytes),)) + time_bytes + b''.join(
+            self.PAIR.pack(index, value) for index, value in enumerate(values) if value == value)
+        record = self.HEADER.pack(len(body), zlib.crc32(body)) + body
+        self.file.write(record)
+        self.records += 1
+        self.bytes_written += len(record)
+        now = time.monotonic()
+        if now - self.last_sync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+
+    def rotate(self):
+        """Ferme le segment courant, en ouvre un nouveau et retourne le chemin de l'ancien."""
+        path = self.path
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self._open_segment()
+        return path
+
+    def discard(self, path):
+        """Supprime un segment dont les données sont écrites dans les CSV."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Ferme le segment courant et le supprime s'il est vide."""
+        self.file.close()
+        if os.path.getsize(self.path) == 0:
+            self.discard(self.path)
+
+    @classmethod
+    def read_segment(cls, path):
+        """Lit les échantillons d'un segment, jusqu'au premier enregistrement tronqué ou corrompu."""
+        with open(path, 'rb') as file:
+            data = file.read()
+        offset = 0
+        while offset + cls.HEADER.size <= len(data):
+            length, crc = cls.HEADER.unpack_from(data, offset)
+            start = offset + cls.HEADER.size
+            body = data[start:start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                print(f"Spool {path}: enregistrement invalide à l'octet {offset}, fin de lecture")
+                return
+            time_len = body[0]
+            time_str = body[1:1 + time_len].decode('ascii')
+            values = [math.nan] * len(FIELDS)
+            for index, value in cls.PAIR.iter_unpack(body[1 + time_len:]):
+                if index < len(values):
+                    values[index] = value
+            yield time_str, values
+            offset = start + length
+
+
+class Aggregator:
+    """Double tampon pour l'agrégation des données par seconde.
+
+    Le thread réseau MQTT remplit le tampon courant avec `add`. Le thread
+    d'écriture prend atomiquement ce tampon avec `swap` et le remplace par un
+    tampon ne contenant que les AGGREGATION_HOLD secondes les plus récentes,
+    qui peuvent encore recevoir des échantillons: les échantillons reçus
+    pendant l'écriture vont dans le nouveau tampon et aucune itération ne se
+    fait sur un dictionnaire modifié.
+    """
+
+    def __init__(self, spool=None):
+        self.lock = threading.Lock()
+        self.buffer = {}
+        self.samples = 0
+        self.spool = spool
+        self.last_add = time.monotonic()
+        # Segments de spool contenant des échantillons de secondes gardées dans
+        # le tampon: (chemin, dernière seconde gardée, en secondes depuis l'époque)
+        self.held_segments = []
+        # Statistiques des fenêtres écrites
+        self.windows = 0
+        self.total_samples = 0
+        self.last_window_samples = 0
+        self.last_window_seconds = 0
+        self.max_window_samples = 0
+
+    def add(self, time_str, values):
+        """Ajoute un échantillon (valeurs dans l'ordre de FIELDS, NaN si absente) à la seconde `time_str`."""
+        with self.lock:
+            entry = self.buffer.get(time_str)
+            if entry is None:
+                entry = self.buffer[time_str] = SecondStats()
+            for index, value in enumerate(values):
+                if value == value:  # NaN: champ absent du message
+                    entry.add(index, value)
+            entry.samples += 1
+            self.samples += 1
+            self.last_add = time.monotonic()
+            if self.spool is not None:
+                try:
+                    self.spool.append(time_str, values)
+                except OSError as e:
+                    print(f"Erreur d'écriture du spool: {e}")
+
+    def _held(self, final):
+        """Secondes à garder dans le tampon: les AGGREGATION_HOLD plus récentes,
+        aucune avec `final` ou si plus rien n'est reçu depuis AGGREGATION_HOLD secondes."""
+        if final or not self.buffer or time.monotonic() - self.last_add > AGGREGATION_HOLD:
+            return {}
+        epochs = {}
+        for time_key in self.buffer:
+            try:
+                epochs[time_key] = epoch_seconds(time_key)
+            except ValueError:
+                pass  # Time illisible: écrit tel quel
+        if not epochs:
+            return {}
+        threshold = max(epochs.values()) - AGGREGATION_HOLD + 1
+        return {time_key: epoch for time_key, epoch in epochs.items() if epoch >= threshold}
+
+    def swap(self, final=False):
+        """Détache les secondes terminées du tampon courant (toutes avec `final`).
+
+        Retourne les secondes détachées, leur nombre d'échantillons et les
+        segments de spool qui peuvent être supprimés une fois ces secondes
+        écrites (liste vide sans spool).
+        """
+        with self.lock:
+            held = self._held(final)
+            buffer, kept = {}, {}
+            for time_key, stats in self.buffer.items():
+                (kept if time_key in held else buffer)[time_key] = stats
+            samples = self.samples - sum(stats.samples for stats in kept.values())
+            self.buffer = kept
+            self.samples -= samples
+            segments = []
+            if self.spool is not None and buffer:
+                try:
+                    self.held_segments.append((self.spool.rotate(), max(held.values(), default=None)))
+                except OSError as e:
+                    print(f"Erreur de rotation du spool: {e}")
+                # Un segment peut être supprimé quand plus aucune de ses secondes n'est gardée
+                first_held = min(held.values(), default=None)
+                pending = []
+                for path, last_held in self.held_segments:
+                    if first_held is None or last_held is None or last_held < first_held:
+                        segments.append(path)
+                    else:
+                        pending.append((path, last_held))
+                self.held_segments = pending
+        if buffer:
+            WINDOW_SAMPLES.observe(samples)
+            self.windows += 1
+            self.total_samples += samples
+            self.last_window_samples = samples
+            self.last_window_seconds = len(buffer)
+            self.max_window_samples = max(self.max_window_samples, samples)
+        return buffer, samples, segments
+
+    def keep_segments(self):
+        """Laisse sur le disque les segments en attente après une écriture en échec:
+        ils seront rejoués au prochain démarrage."""
+        with self.lock:
+            self.held_segments = []
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def stats(self):
+        """Retourne les compteurs d'échantillons par fenêtre écrite."""
+        return {
+            "windows": self.windows,
+            "samples": self.total_samples,
+            "pending": self.samples,
+            "last_window_samples": self.last_window_samples,
+            "last_window_seconds": self.last_window_seconds,
+            "max_window_samples": self.max_window_samples,
+            "avg_window_samples": self.total_samples / self.windows if self.windows else 0.0,
+        }
+
+
+class SampleQueue:
+    """File bornée entre le thread réseau MQTT et le thread d'ingestion.
+
+    `put` est appelé par on_message et ne fait aucune écriture de fichier tant
+    que la file n'est pas pleine. Quand elle l'est, la politique `policy`
+    s'applique: `block` attend une place (le broker ralentit l'envoi),
+    `drop-oldest` remplace le message le plus ancien, `spill` ajoute les
+    messages bruts à un fichier de débordement (enregistrements au format du
+    Spool) relu dans l'ordre par `get_batch`.
+    """
+
+    def __init__(self, maxsize, policy="block", spill_path=None):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.spill_path = spill_path
+        self.spill_file = None
+        self.spilled = 0       # messages du fichier de débordement pas encore relus
+        self.spill_offset = 0  # position de lecture dans le fichier de débordement
+        if policy == "spill":
+            os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+            # La file mémoire n'est pas conservée après un arrêt: le débordement non plus
+            self.spill_file = open(spill_path, 'w+b', buffering=0)
+
+    def __len__(self):
+        return len(self.items) + self.spilled
+
+    def put(self, item, payload):
+        """Ajoute un message décodé (`payload` est le message brut, pour le débordement sur disque)."""
+        with self.cond:
+            if len(self.items) >= self.maxsize or self.spilled:
+                if self.policy == "block":
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.cond.wait(1)
+                elif self.policy == "drop-oldest":
+                    self.items.popleft()
+                    QUEUE_DROPPED.inc()
+                else:
+                    self._spill(item[0], payload)
+                    self.cond.notify()
+                    return
+            self.items.append(item)
+            self.cond.notify()
+
+    def _spill(self, topic, payload):
+        topic_bytes = topic.encode('utf-8')[:255]
+        body = bytes((len(topic_bytes),)) + topic_bytes + payload
+        self.spill_file.seek(0, os.SEEK_END)
+        self.spill_file.write(Spool.HEADER.pack(len(body), zlib.crc32(body)) + body)
+        self.spilled += 1
+        QUEUE_SPILLED.inc()
+
+    def _unspill(self, count):
+        """Relit jusqu'à `count` messages bruts du fichier de débordement (sous le verrou)."""
+        self.spill_file.seek(self.spill_offset)
+        payloads = []
+        while len(payloads) < count and self.spilled:
+            length, crc = Spool.HEADER.unpack(self.spill_file.read(Spool.HEADER.size))
+            body = self.spill_file.read(length)
+            self.spilled -= 1
+            if zlib.crc32(body) == crc:
+                topic_len = body[0]
+                payloads.append((body[1:1 + topic_len].decode('utf-8'), body[1 + topic_len:]))
+        self.spill_offset = self.spill_file.tell()
+        if not self.spilled:
+            self.spill_file.truncate(0)
+            self.spill_offset = 0
+        return payloads
+
+    def get_batch(self, count, timeout=1.0):
+        """Retourne jusqu'à `count` messages (topic, sample), [] si la file est vide après `timeout` secondes."""
+        spilled = None
+        with self.cond:
+            if not self.items and not self.spilled and not self.closed:
+                self.cond.wait(timeout)
+            batch = []
+            items = self.items
+            while items and len(batch) < count:
+                batch.append(items.popleft())
+            if not batch and self.spilled:
+                spilled = self._unspill(count)
+            self.cond.notify_all()
+        if spilled:
+            # Messages déjà décodés une fois avant le débordement: le décodage ne peut pas échouer
+            batch = [(topic, decode_payload(payload)) for topic, payload in spilled]
+        return batch
+
+    def close(self):
+        """Débloque les producteurs et le consommateur, qui vide ensuite la file."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def discard_spill(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            try:
+                os.remove(self.spill_path)
+            except FileNotFoundError:
+                pass
+
+
+class CsvDayWriter:
+    """Writer CSV gardé ouvert pendant toute la journée.
+
+    Les lignes sont accumulées dans le tampon du fichier et écrites sur le disque
+    toutes les `flush_rows` lignes, au plus tard après `flush_interval` secondes,
+    et toujours à la fermeture. Les octets et lignes écrits sont comptabilisés
+    pour surveiller le débit d'écriture sur la carte SD.
+    """
+
+    KIND = "csv"  # label des métriques de lignes et d'octets écrits
+
+    def __init__(self, path, headers, day=None, flush_rows=None, flush_interval=None, fsync=None):
+        self.path = path
+        self.headers = headers
+        self.day = day
+        self.flush_rows = FLUSH_ROWS if flush_rows is None else flush_rows
+        self.flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.fsync = FSYNC if fsync is None else fsync
+        self.lock = threading.Lock()
+        self._open()
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        self.opened = self.last_flush
+        self.last_write = self.last_flush
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.flushes = 0
+
+    def _select_path(self):
+        """Garde le fichier s'il a les en-têtes attendus, sinon écrit dans un segment
+        `<nom>.v<n>.<ext>`: un changement de colonnes ne mélange jamais deux formats."""
+        base, ext = os.path.splitext(self.path)
+        path = self.path
+        version = 1
+        while os.path.exists(path) and os.path.getsize(path) and \
+                self._existing_headers(path) != list(self.headers):
+            version += 1
+            path = f"{base}.v{version}{ext}"
+        if path != self.path:
+            print(f"En-têtes différents dans {self.path}: écriture dans {path}")
+            self.path = path
+
+    def _existing_headers(self, path):
+        with open(path, newline='') as file:
+            return next(csv.reader(file), None)
+
+    def _open(self):
+        self._select_path()
+        self.file = open(self.path, mode='a', newline='', buffering=WRITE_BUFFER)
+        self.writer = csv.writer(self.file)
+        self.offset = self.file.tell()
+        if self.offset == 0:
+            if VERBOSE: print(f'Ecris les entêtes de {self.path}')
+            self.writer.writerow(self.headers)
+
+    def _write(self, row):
+        self.writer.writerow(row)
+
+    def writerow(self, row):
+        """Ajoute une ligne et applique la politique de flush."""
+        with self.lock:
+            self._write(row)
+            self.rows_written += 1
+            self.pending_rows += 1
+            ROWS_WRITTEN.inc_label(self.KIND)
+            self.last_write = time.monotonic()
+            if self.pending_rows >= self.flush_rows or self.last_write - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def writerows(self, rows):
+        """Ajoute plusieurs lignes et applique la politique de flush."""
+        with self.lock:
+            for row in rows:
+                self._write(row)
+                self.rows_written += 1
+                self.pending_rows += 1
+            ROWS_WRITTEN.inc_label(self.KIND, len(rows))
+            self.last_write = time.monotonic()
+            if self.pending_rows >= self.flush_rows or self.last_write - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush_if_due(self):
+        """Flush si des lignes attendent depuis plus de `flush_interval` secondes."""
+        with self.lock:
+            if self.pending_rows and time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self._flush()
+            self.file.close()
+
+    def _flush(self):
+        start = time.monotonic()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        offset = self.file.tell()
+        BYTES_WRITTEN.inc_label(self.KIND, offset - self.offset)
+        self.bytes_written += offset - self.offset
+        self.offset = offset
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        self.flushes += 1
+        FLUSH_SECONDS.observe(self.last_flush - start)
+
+    def stats(self):
+        """Retourne les compteurs d'écriture du fichier."""
+        elapsed = max(time.monotonic() - self.opened, 1e-9)
+        return {
+            "path": self.path,
+            "rows": self.rows_written,
+            "bytes": self.bytes_written,
+            "flushes": self.flushes,
+            "bytes_per_s": self.bytes_written / elapsed,
+        }
+
+
+class BinaryDayWriter(CsvDayWriter):
+    """Writer du fichier binaire jour (format décrit dans energie_store).
+
+    Les lignes sont des tuples (Time, valeurs dans l'ordre de `headers`, count);
+    la politique de flush est celle des fichiers CSV.
+    """
+
+    KIND = "bin"
+
+    def _existing_headers(self, path):
+        try:
+            with open(path, 'rb') as file:
+                return parse_binary_header(file.read(HEADER_SIZE))
+        except (ValueError, struct.error):
+            return None
+
+    def _open(self):
+        self.record = record_struct(self.headers)
+        self._select_path()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size:
+            # Supprimer un enregistrement incomplet laissé par un arrêt brutal
+            excess = (size - HEADER_SIZE) % self.record.size
+            if excess:
+                os.truncate(self.path, size - excess)
+        self.file = open(self.path, mode='ab', buffering=WRITE_BUFFER)
+        self.offset = self.file.tell()
+        if self.offset == 0:
+            self.file.write(binary_header(self.headers))
+
+    def _write(self, row):
+        time_str, values, count = row
+        self.file.write(self.record.pack(epoch_seconds(time_str), *values, count))
+
+
+# Writers ouverts, indexés par chemin de fichier
+writers = {}
+writers_lock = threading.Lock()
+# Jour le plus récent vu dans les messages (AAAAMMJJ)
+current_day = None
+
+
+def message_day(time_str):
+    """Retourne le jour AAAAMMJJ du champ Time d'un message ("2026-01-14T10:09:41")."""
+    day = time_str[:10].replace('-', '')
+    if len(day) == 8 and day.isdigit():
+        return day
+    return datetime.now().strftime('%Y%m%d')
+
+
+def get_writer(path, headers, day, factory=CsvDayWriter):
+    """Retourne le writer ouvert du fichier `path` du jour `day`, en le créant au besoin."""
+    global current_day
+    writer = writers.get(path)
+    if writer is None:
+        with writers_lock:
+            writer = writers.get(path)
+            if writer is None:
+                writer = factory(path, headers, day)
+                writers[path] = writer
+                if current_day is None or day > current_day:
+                    if current_day is not None:
+                        print(f"Nouveau jour {day}: rotation des fichiers de sortie")
+                    current_day = day
+    return writer
+
+
+def close_rotated_writers():
+    """Ferme les writers des jours passés sans écriture depuis ROTATION_GRACE secondes."""
+    now = time.monotonic()
+    with writers_lock:
+        for path, writer in list(writers.items()):
+            if writer.day != current_day and now - writer.last_write >= ROTATION_GRACE:
+                try:
+                    writer.close()
+                except Exception as e:
+                    print(f"Erreur lors de la fermeture de {path}: {e}")
+                print_writer_stats(writer)
+                del writers[path]
+
+
+def flush_writers():
+    """Applique la politique de flush temporelle à tous les writers ouverts."""
+    for writer in list(writers.values()):
+        try:
+            writer.flush_if_due()
+        except Exception as e:
+            print(f"Erreur lors du flush de {writer.path}: {e}")
+
+
+def close_writers():
+    """Ferme tous les writers (flush + fsync) et affiche le bilan d'écriture."""
+    with writers_lock:
+        for writer in writers.values():
+            try:
+                writer.close()
+            except Exception as e:
+                print(f"Erreur lors de la fermeture de {writer.path}: {e}")
+            print_writer_stats(writer)
+        writers.clear()
+
+
+def print_writer_stats(writer):
+    stats = writer.stats()
+    print(f"{stats['path']}: {stats['rows']} lignes, {stats['bytes']} octets, "
+          f"{stats['flushes']} flush, {stats['bytes_per_s']:.1f} octets/s")
+
+
+class Device:
+    """Un compteur Tasmota, avec son agrégation, son spool et ses fichiers de sortie.
+
+    Les fichiers du compteur principal (PRIMARY_DEVICE) restent directement
+    dans DATA_DIR, ceux des autres compteurs vont dans DATA_DIR/<compteur>.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.directory = DATA_DIR if name == PRIMARY_DEVICE else os.path.join(DATA_DIR, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.aggregation = Aggregator()
+        self.rollups = Rollups() if ROLLUP else None
+        if SPOOL:
+            # Rejouer les données non écrites d'une exécution précédente, puis journaliser les suivantes
+            spool = Spool(os.path.join(self.directory, SPOOL_DIR))
+            replay_spool(self, spool)
+            self.aggregation.spool = spool
+
+    def file(self, template, day, **fields):
+        """Chemin du fichier du jour `day` pour le modèle `template`."""
+        return os.path.join(self.directory, template.format(date=day, **fields))
+
+    def close(self):
+        if self.aggregation.spool is not None:
+            self.aggregation.spool.close()
+
+
+# Compteurs connus, indexés par nom, et cache sujet MQTT -> compteur
+devices = {}
+topic_devices = {}
+devices_lock = threading.Lock()
+
+
+def device_name(topic):
+    """Nom du compteur d'un sujet Tasmota "tele/<compteur>/SENSOR".
+
+    Le nom sert de répertoire de sortie: None s'il ne respecte pas
+    DEVICE_NAME_RE (par exemple "tele/../SENSOR").
+    """
+    parts = topic.split('/')
+    name = parts[1] if len(parts) >= 3 else topic.replace('/', '_')
+    return name if DEVICE_NAME_RE.match(name) else None
+
+
+def get_device(topic):
+    """Retourne le compteur du sujet `topic`, en le créant au premier message.
+
+    Retourne None si le nom du compteur est invalide ou si MAX_DEVICES
+    compteurs existent déjà.
+    """
+    device = topic_devices.get(topic)
+    if device is None:
+        name = device_name(topic)
+        if name is None:
+            return None
+        with devices_lock:
+            device = devices.get(name)
+            if device is None:
+                if len(devices) >= MAX_DEVICES:
+                    return None
+                print(f"Nouveau compteur: {name} ({topic})")
+                device = devices[name] = Device(name)
+            topic_devices[topic] = device
+    return device
+
+
+def count_malformed(message):
+    """Compte un message ignoré et affiche les premiers."""
+    global malformed_payloads
+    malformed_payloads += 1
+    if VERBOSE or malformed_payloads <= 10:
+        print(f"Message invalide ignoré ({malformed_payloads}): {message}")
+
 
 def on_connect(client, userdata, flags, reason_code, properties):
     print(f"Connected with result code {reason_code}")
-    client.subscribe(MQTT_TOPIC)
+    CONNECTS.inc()
+    client.subscribe([(topic, 0) for topic in MQTT_TOPICS])
+
+
+def on_disconnect(client, userdata, disconnect_flags, reason_code, properties):
+    print(f"Disconnected with result code {reason_code}")
+    DISCONNECTS.inc()
 
 
 def on_message(client, userdata, msg):
     if VERBOSE: print(f"{msg.topic}: {str(msg.payload)}")
+    # Sujet invalide rejeté avant toute création de compteur, de fichier ou de métrique
+    if msg.topic not in topic_devices and device_name(msg.topic) is None:
+        count_malformed(f"nom de compteur invalide dans le sujet {msg.topic!r}")
+        return
+    MESSAGES.inc_label(msg.topic)
 
-    payload = json.loads(msg.payload.decode())
-    if VERBOSE: print(f"Received data: {payload}")
-
+    start = time.perf_counter()
     try:
-        time_str = payload.get("Time", "")
-        z_data = payload.get("z", {})
+        sample = decode_payload(msg.payload)
+        DECODE_SECONDS.observe(time.perf_counter() - start)
+    except (ValueError, TypeError) as e:
+        count_malformed(e)
+        return
+    if VERBOSE: print(f"Received data: {sample}")
+    # Aucune écriture de fichier dans le thread réseau: le thread d'ingestion traite la file
+    sample_queue.put((msg.topic, sample), msg.payload)
+
 
+def process_batch(batch):
+    """Traite un lot de messages décodés (topic, sample) pris dans la file."""
+    for topic, sample in batch:
+        device = get_device(topic)
+        if device is None:
+            count_malformed(f"trop de compteurs ({MAX_DEVICES}), sujet {topic!r} ignoré")
+            continue
+        if sample.extra is not None:
+            process_unknown_fields(device, sample)
+            if sample.ts is None and all(v != v for v in sample.values):
+                continue  # fragment sans aucun champ du schéma
         # Vérifier si c'est un message TS (résumé 5 minutes)
-        if "TS" in z_data:
+        if sample.ts is not None:
             # Traiter comme résumé TS
-            process_ts_summary(time_str, z_data)
+            process_ts_summary(device, sample)
         else:
             # Traiter comme données individuelles à agréger par seconde
-            process_single_data(time_str, z_data)
+            process_single_data(device, sample)
 
-    except json.JSONDecodeError as e:
-        print(f"Erreur de parsing JSON: {e}")
 
+def ingest_loop():
+    """Thread d'ingestion: vide la file par lots jusqu'à sa fermeture."""
+    while True:
+        batch = sample_queue.get_batch(QUEUE_BATCH)
+        if batch:
+            QUEUE_BATCHES.observe(len(batch))
+            try:
+                process_batch(batch)
+            except Exception as e:
+                print(f"Erreur lors du traitement d'un lot de {len(batch)} messages: {e}")
+        elif sample_queue.closed and not len(sample_queue):
+            return
 
-def process_ts_summary(time_str, z_data):
-    """Traite les résumés TS et les écrit dans le fichier CSV dédié."""
-    if VERBOSE: print(f"process_ts_summary: {time_str} - {z_data}")
-    ts_data = {
-        "Time": time_str,
-        "TS": z_data.get("TS"),
-        "NS": z_data.get("NS"),
-        "Pi": z_data.get("Pi"),
-        "Po": z_data.get("Po"),
-        "B1": z_data.get("B1"),
-        "B2": z_data.get("B2"),
-        "E1": z_data.get("E1"),
-        "E2": z_data.get("E2"),
-        "P1i": z_data.get("P1i"),
-        "P2i": z_data.get("P2i"),
-        "P3i": z_data.get("P3i"),
-        "P1o": z_data.get("P1o"),
-        "P2o": z_data.get("P2o"),
-        "P3o": z_data.get("P3o"),
-        "I1": z_data.get("I1"),
-        "I2": z_data.get("I2"),
-        "I3": z_data.get("I3"),
-        "U1": z_data.get("U1"),
-        "U2": z_data.get("U2"),
-        "U3": z_data.get("U3")
-    }
 
+def start_ingest():
+    """Crée la file des messages décodés et démarre le thread d'ingestion."""
+    global sample_queue
+    spill_path = os.path.join(DATA_DIR, SPOOL_DIR, QUEUE_SPILL_FILE)
+    sample_queue = SampleQueue(QUEUE_SIZE, QUEUE_POLICY, spill_path)
+    thread = threading.Thread(target=ingest_loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_ingest(thread):
+    """Ferme la file et attend que le thread d'ingestion l'ait vidée."""
+    sample_queue.close()
+    thread.join()
+    sample_queue.discard_spill()
+
+
+def process_unknown_fields(device, sample):
+    """Compte les champs hors schéma d'un message et les écrit à part avec --schema-policy evolve."""
+    for name in sample.extra:
+        if name not in UNKNOWN_FIELDS.values:
+            print(f"Champ inconnu du schéma v{SCHEMA_VERSION}: {name!r} ({device.name}, "
+                  f"{'écrit dans ' + EXTRA_CSV_FILE if SCHEMA_POLICY == 'evolve' else 'ignoré'})")
+        UNKNOWN_FIELDS.inc_label(name)
+    if SCHEMA_POLICY != "evolve":
+        return
+    day = message_day(sample.time)
+    path = device.file(EXTRA_CSV_FILE, day)
+    rows = [[sample.time, name, value] for name, value in sample.extra.items()]
+    try:
+        get_writer(path, EXTRA_HEADERS, day).writerows(rows)
+    except Exception as e:
+        print(f"Erreur lors de l'écriture dans {path}: {e}")
+
+
+def process_ts_summary(device, sample):
+    """Traite les résumés TS et les écrit dans le fichier CSV dédié."""
+    if VERBOSE: print(f"process_ts_summary: {device.name} {sample}")
     # Écrire dans le fichier CSV des résumés TS
-    write_ts_to_csv(ts_data)
+    write_ts_to_csv(device, sample)
 
 
-def process_single_data(time_str, z_data):
+def process_single_data(device, sample):
     """ cumule les données pendant la même seconde pour condenser les sorties """
-    if VERBOSE: print(f"process_single_data: {time_str} - {z_data}")
-    # nouvelle seconde, il n'y a pas encore d'entrées 
-    if aggregation[time_str] == []:
-        aggregation[time_str] = z_data  
-    # même seconde: mise à jour de l'élément 
-    else:
-        aggregation[time_str].update(z_data)
-
-
-def write_ts_to_csv(data):
-    """Écrit les résumés TS dans le fichier CSV dédié."""
-    headers = [
-        "Time", "TS", "NS", "Pi", "Po",
-        "B1", "B2", "E1", "E2",
-        "P1i", "P2i", "P3i", "P1o", "P2o", "P3o",
-        "I1", "I2", "I3", "U1", "U2", "U3"
-    ]
+    if VERBOSE: print(f"process_single_data: {device.name} {sample}")
+    device.aggregation.add(sample.time, sample.values)
 
+
+def write_ts_to_csv(device, sample):
+    """Écrit les résumés TS dans le fichier CSV du jour du message."""
+    day = message_day(sample.time)
+    row = [sample.time, sample.ts, sample.ns] + ['' if v != v else v for v in sample.values]
+    path = device.file(TS_CSV_FILE, day)
     try:
-        with open(TS_CSV_FILE, mode='a', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=headers)
-            if file.tell() == 0:
-                if VERBOSE: print('Ecris les entêtes')
-                writer.writeheader()
-            writer.writerow(data)
+        get_writer(path, TS_HEADERS, day).writerow(row)
     except Exception as e:
-        print(f"Erreur lors de l'écriture dans {TS_CSV_FILE}: {e}")
+        print(f"Erreur lors de l'écriture dans {path}: {e}")
 
-    if VERBOSE: print(f"Résumé TS enregistré: {data}")
+    if VERBOSE: print(f"Résumé TS enregistré: {row}")
 
 
-def write_aggregation_to_csv():
-    """Écrit les données agrégées par seconde dans le fichier CSV."""
-    if VERBOSE: print('write_aggregation_to_csv')
-    if VERBOSE: print(aggregation)
-    headers = [
-        "Time", "Pi", "Po",
-        "B1", "B2", "E1", "E2",
-        "P1i", "P2i", "P3i", "P1o", "P2o", "P3o",
-        "I1", "I2", "I3", "U1", "U2", "U3",
-        "count"  # Nombre de mesures dans cette seconde
-    ]
+def write_aggregation_to_csv(device, final=False):
+    """Écrit les données agrégées par seconde d'un compteur dans le fichier CSV.
 
-    try:
-        with open(AGGREGATE_CSV_FILE, mode='a', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=headers)
-            if file.tell() == 0:
-                if VERBOSE: print('writer.writeheader')
-                writer.writeheader()
-
-            # Pour chaque seconde, calculer les moyennes et écrire
-            for time_key, data_list in aggregation.items():
-                if VERBOSE: print(f"key: {time_key} - {data_list}")
-                if data_list:  # Vérifier qu'il y a des données
-                    data_list.update({'Time': time_key.replace('T',' ')})
-                    count = len(data_list)
-                    writer.writerow(data_list)
-                    if VERBOSE: print(f"Agrégation seconde écrite pour {time_key}: {count} mesures")
-
-        # Réinitialiser l'agrégation après écriture
-        aggregation.clear()
+    Les secondes les plus récentes restent dans le tampon jusqu'à l'écriture
+    suivante, sauf avec `final` (arrêt du programme).
+    """
+    if VERBOSE: print(f'write_aggregation_to_csv: {device.name}')
+    aggregation = device.aggregation
+    # Prendre les secondes terminées, le thread MQTT continue dans le tampon
+    buffer, samples, segments = aggregation.swap(final)
+    if not buffer:
+        return
+    durable = aggregation.spool is not None
+    # Les segments de spool ne sont supprimés que si toutes leurs secondes sont sur le disque
+    if not write_seconds(device, buffer, samples, durable=durable):
+        aggregation.keep_segments()
+    elif durable:
+        for segment in segments:
+            aggregation.spool.discard(segment)
 
-    except Exception as e:
-        print(f"Erreur lors de l'écriture dans {AGGREGATE_CSV_FILE}: {e}")
+
+def write_seconds(device, buffer, samples, skip_until=None, durable=False):
+    """Écrit les secondes agrégées de `buffer` dans les fichiers de leur jour.
+
+    `skip_until` (jour -> Time) permet d'ignorer les secondes déjà présentes
+    dans un fichier. Avec `durable`, les fichiers CSV et binaires sont flushés
+    immédiatement. Retourne True si toutes les lignes sont écrites.
+    """
+    headers = AGGREGATE_HEADERS + MINMAX_HEADERS if MINMAX else AGGREGATE_HEADERS
+    # Regrouper les secondes par jour: chaque ligne va dans le fichier de son jour
+    days = {}
+    binary_days = {}
+    for time_key, stats in sorted(buffer.items()):
+        day = message_day(time_key)
+        time_value = time_key.replace('T', ' ')
+        if skip_until and time_value <= skip_until.get(day, ''):
+            continue
+        means, extremes = stats.row(MINMAX)
+        row = [time_value] + means + [stats.samples] + extremes
+        days.setdefault(day, []).append(row)
+        if BINARY:
+            binary_days.setdefault(day, []).append((time_key, stats.means(), stats.samples))
+        if device.rollups is not None:
+            device.rollups.add(time_key, stats)
+        if VERBOSE: print(f"Agrégation seconde écrite pour {time_key}: {stats.samples} mesures")
+
+    ok = True
+    for day, rows in days.items():
+        path = device.file(AGGREGATE_CSV_FILE, day)
+        try:
+            writer = get_writer(path, headers, day)
+            writer.writerows(rows)
+            if durable:
+                writer.flush()
+        except Exception as e:
+            print(f"Erreur lors de l'écriture dans {path}: {e}")
+            print(f"Secondes non écrites: {len(rows)}")
+            ok = False
+    # Le spool n'est vidé que si le fichier binaire est lui aussi sur le disque
+    for day, rows in binary_days.items():
+        path = device.file(AGGREGATE_BIN_FILE, day)
+        try:
+            writer = get_writer(path, FIELDS, day, BinaryDayWriter)
+            writer.writerows(rows)
+            if durable:
+                writer.flush()
+        except Exception as e:
+            print(f"Erreur lors de l'écriture dans {path}: {e}")
+            ok = False
+    if device.rollups is not None:
+        write_rollups(device)
+    if VERBOSE: print(f"Fenêtre écrite: {len(buffer)} secondes, {samples} échantillons")
+    return ok
+
+
+def write_rollups(device, final=False):
+    """Écrit les intervalles terminés de la pyramide d'agrégats (tous avec `final`)."""
+    files = {}
+    for level, day, row in device.rollups.closed(final):
+        files.setdefault((level, day), []).append(row)
+    for (level, day), rows in files.items():
+        path = device.file(ROLLUP_CSV_FILE, day, level=level)
+        try:
+            get_writer(path, ROLLUP_HEADERS, day).writerows(rows)
+        except Exception as e:
+            print(f"Erreur lors de l'écriture dans {path}: {e}")
+
+
+def last_csv_time(path):
+    """Retourne la valeur Time la plus récente des dernières lignes complètes
+    d'un fichier CSV jour et de ses segments `.v<n>.csv` ('' si absente)."""
+    latest = ''
+    for segment in day_segments(path):
+        try:
+            with open(segment, 'rb') as file:
+                file.seek(0, os.SEEK_END)
+                size = file.tell()
+                file.seek(max(0, size - 4096))
+                lines = file.read().split(b'\n')
+        except OSError:
+            continue
+        # La dernière ligne peut être incomplète après un arrêt brutal
+        for line in reversed(lines[:-1]):
+            if line and not line.startswith(b'Time'):
+                latest = max(latest, line.split(b',', 1)[0].decode('ascii', 'replace'))
+                break
+    return latest
+
+
+def replay_spool(device, spool):
+    """Rejoue dans les fichiers du jour les segments de spool d'une exécution précédente."""
+    if not spool.recovered:
+        return
+    replay = Aggregator()
+    for path in spool.recovered:
+        for time_str, values in Spool.read_segment(path):
+            replay.add(time_str, values)
+    buffer, samples, _ = replay.swap(final=True)
+    # Les secondes déjà écrites avant l'arrêt ne sont pas dupliquées
+    skip_until = {}
+    for time_key in buffer:
+        day = message_day(time_key)
+        if day not in skip_until:
+            skip_until[day] = last_csv_time(device.file(AGGREGATE_CSV_FILE, day))
+    print(f"Spool {device.name}: {len(spool.recovered)} segments rejoués, "
+          f"{samples} échantillons, {len(buffer)} secondes")
+    if write_seconds(device, buffer, samples, skip_until, durable=True):
+        for path in spool.recovered:
+            spool.discard(path)
+        spool.recovered = []
+
+
+def print_aggregation_stats(device):
+    stats = device.aggregation.stats()
+    print(f"Agrégation {device.name}: {stats['windows']} fenêtres, {stats['samples']} échantillons, "
+          f"moyenne {stats['avg_window_samples']:.1f}/fenêtre, max {stats['max_window_samples']}, "
+          f"dernière {stats['last_window_samples']} échantillons sur {stats['last_window_seconds']} secondes")
 
 
 def periodic_write():
-    """Fonction qui écrit périodiquement les données agrégées."""
-    global stop_program
+    """Fonction qui écrit périodiquement les données agrégées de tous les compteurs."""
     if VERBOSE: print('periodic_write()')
+    # Les flush temporels suivent FLUSH_INTERVAL même s'il est inférieur à la minute
+    tick = max(0.1, min(60, FLUSH_INTERVAL))
+    last_write = time.monotonic()
     while True:
-        time.sleep(60)  # Écrire toutes les minutes
-        if aggregation:
-            if VERBOSE: print("Écriture périodique des données agrégées par seconde...")
-            write_aggregation_to_csv()
-        
-        # Vérifier si la date a changé
-        current_date = datetime.now().strftime('%Y%m%d')
-        if current_date != DATE:
-            print("Fin de journée, arrêt de script")
-            stop_program = True
-            break
+        time.sleep(tick)
+        if time.monotonic() - last_write < 60:
+            flush_writers()
+            continue
+        last_write = time.monotonic()
+        for device in list(devices.values()):  # Écrire toutes les minutes
+            if device.aggregation:
+                if VERBOSE: print("Écriture périodique des données agrégées par seconde...")
+                write_aggregation_to_csv(device)
+        flush_writers()
+        # Fermer les fichiers de la veille une fois les dernières données écrites
+        close_rotated_writers()
+        if STATS_FILE:
+            try:
+                write_stats_file(METRICS, STATS_FILE)
+            except OSError as e:
+                print(f"Erreur lors de l'écriture de {STATS_FILE}: {e}")
+        if VERBOSE:
+            for device in list(devices.values()):
+                print_aggregation_stats(device)
+            for writer in list(writers.values()):
+                print_writer_stats(writer)
+
+
+def shutdown():
+    """Écrit les données agrégées restantes de tous les compteurs et ferme les fichiers."""
+    for device in list(devices.values()):
+        write_aggregation_to_csv(device, final=True)
+        if device.rollups is not None:
+            write_rollups(device, final=True)
+        print_aggregation_stats(device)
+    print(f"Messages invalides ignorés: {malformed_payloads}")
+    close_writers()
+    for device in list(devices.values()):
+        device.close()
 
 
 def parse_arguments():
@@ -184,6 +1204,33 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='MQTT to CSV Converter')
     parser.add_argument('-v', '--verbose', action='store_true', 
                        help='Active le mode verbose pour plus de sorties console')
+    parser.add_argument('-t', '--topic', action='append', dest='topics',
+                       help=f'Sujet MQTT à suivre, jokers + et # acceptés, répétable (défaut: {" ".join(MQTT_TOPICS)})')
+    parser.add_argument('--flush-rows', type=int, default=FLUSH_ROWS,
+                       help=f'Flush des fichiers CSV toutes les N lignes (défaut: {FLUSH_ROWS})')
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL,
+                       help=f'Flush des fichiers CSV au plus tard après T secondes (défaut: {FLUSH_INTERVAL})')
+    parser.add_argument('--minmax', action='store_true',
+                       help='Ajoute les colonnes min/max par seconde au fichier energie')
+    parser.add_argument('--no-binary', action='store_true',
+                       help='Ne pas écrire le fichier binaire energie_<aaaammjj>.bin')
+    parser.add_argument('--no-rollup', action='store_true',
+                       help='Ne pas écrire les agrégats rollup_<niveau>_<aaaammjj>.csv (10s, 1min, 15min, 1h)')
+    parser.add_argument('--no-spool', action='store_true',
+                       help="Désactive le journal d'écriture anticipée des données agrégées")
+    parser.add_argument('--no-fsync', action='store_true',
+                       help='Ne pas appeler fsync après chaque flush')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                       help=f'Taille maximale de la file des messages décodés (défaut: {QUEUE_SIZE})')
+    parser.add_argument('--queue-policy', choices=['block', 'drop-oldest', 'spill'], default=QUEUE_POLICY,
+                       help=f'Politique quand la file est pleine (défaut: {QUEUE_POLICY})')
+    parser.add_argument('--schema-policy', choices=['project', 'evolve'], default=SCHEMA_POLICY,
+                       help='Champs hors schéma: project = ignorés et comptés, '
+                            f'evolve = écrits aussi dans {EXTRA_CSV_FILE} (défaut: {SCHEMA_POLICY})')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                       help='Expose les métriques sur http://127.0.0.1:<port>/metrics (défaut: désactivé)')
+    parser.add_argument('--stats-file', type=str, default=STATS_FILE,
+                       help='Réécrit les métriques en JSON dans ce fichier chaque minute')
     return parser.parse_args()
 
 
@@ -197,9 +1244,35 @@ def signal_handler(sig, frame):
 def main():
     # Parser les arguments de la ligne de commande
     args = parse_arguments()
-    global VERBOSE
+    global VERBOSE, FLUSH_ROWS, FLUSH_INTERVAL, FSYNC, MINMAX, SPOOL, BINARY, MQTT_TOPICS
+    global METRICS_PORT, STATS_FILE, QUEUE_SIZE, QUEUE_POLICY, ROLLUP, SCHEMA_POLICY
     VERBOSE = args.verbose
+    if args.topics:
+        MQTT_TOPICS = args.topics
+    MINMAX = args.minmax
+    FLUSH_ROWS = args.flush_rows
+    FLUSH_INTERVAL = args.flush_interval
+    FSYNC = not args.no_fsync
+    SPOOL = not args.no_spool
+    BINARY = not args.no_binary
+    ROLLUP = not args.no_rollup
+    SCHEMA_POLICY = args.schema_policy
+    METRICS_PORT = args.metrics_port
+    STATS_FILE = args.stats_file
+    QUEUE_SIZE = args.queue_size
+    QUEUE_POLICY = args.queue_policy
+
+    if METRICS_PORT:
+        serve_metrics(METRICS, METRICS_PORT)
+        print(f"Métriques sur http://127.0.0.1:{METRICS_PORT}/metrics")
     
+    # Créer dès le démarrage les compteurs des sujets sans joker (rejeu de leur spool avant la connexion)
+    for topic in MQTT_TOPICS:
+        if '+' not in topic and '#' not in topic:
+            get_device(topic)
+    # Démarrer le thread d'ingestion avant de recevoir les premiers messages
+    ingest_thread = start_ingest()
+
     # Initialiser le client MQTT avec la nouvelle API
     logging.basicConfig(level=logging.INFO)
     if VERBOSE: logging.basicConfig(level=logging.DEBUG)
@@ -213,6 +1286,7 @@ def main():
     client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
     client.on_connect = on_connect
     client.on_message = on_message
+    client.on_disconnect = on_disconnect
 
     # Se connecter au broker
     client.connect(MQTT_BROKER, MQTT_PORT, MQTT_TIMEOUT)
@@ -225,6 +1299,7 @@ def main():
     try:
         client.loop_start()
         print('Script is looping now ... put it in background')
+        if VERBOSE: print(f"Décodage JSON: {JSON_BACKEND}")
         # Démarrer le thread d'écriture périodique
         write_thread = threading.Thread(target=periodic_write, daemon=True)
         write_thread.start()
@@ -233,22 +1308,22 @@ def main():
         while not stop_program:
             time.sleep(1)
 
-        # Arrêt programmé (fin de journée ou signal reçu)
+        # Arrêt programmé (signal reçu)
         print("Arrêt programmé du client MQTT...")
-        # Écrire les données agrégées restantes avant de quitter
-        if aggregation:
-            write_aggregation_to_csv()
         client.loop_stop()
         client.disconnect()
+        # Traiter les messages encore dans la file, puis écrire les données agrégées restantes
+        stop_ingest(ingest_thread)
+        shutdown()
         sys.exit(0)
 
     except KeyboardInterrupt:
         print("Arrêt du client MQTT...")
-        # Écrire les données agrégées restantes avant de quitter
-        if aggregation:
-            write_aggregation_to_csv()
         client.loop_stop()
         client.disconnect()
+        # Traiter les messages encore dans la file, puis écrire les données agrégées restantes
+        stop_ingest(ingest_thread)
+        shutdown()
 
 if __name__ == "__main__":
     main()
@@ -3,6 +3,8 @@
 cd /home/pi/scripts
 . .venv/bin/activate
 python -V
+# mqttToCsv.py change de fichiers à minuit sans s'arrêter,
+# la boucle ne sert qu'à le relancer en cas d'arrêt
 while true; do
   date
   python mqttToCsv.py
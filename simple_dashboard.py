@@ -9,18 +9,22 @@ import glob
 import pandas as pd
 from datetime import datetime, timedelta
 
+from energie_store import read_day_table
+
 def get_available_dates(data_dir="data/"):
     """Retourne la liste des dates disponibles sous forme de datetime"""
+    # Fichiers CSV et fichiers compactés en Parquet
     csv_files = glob.glob(os.path.join(data_dir, "ts_summary_20*.csv"))
-    dates = []
+    csv_files += glob.glob(os.path.join(data_dir, "ts_summary_20*.parquet"))
+    dates = set()
     
     for file in csv_files:
         # Extraire la date du nom de fichier ts_summary_YYYYMMDD.csv
         filename = os.path.basename(file)
-        date_str = filename.replace("ts_summary_", "").replace(".csv", "")
+        date_str = os.path.splitext(filename)[0].replace("ts_summary_", "")
         try:
             date = datetime.strptime(date_str, "%Y%m%d")
-            dates.append(date)
+            dates.add(date)
         except ValueError:
             continue
     
@@ -31,18 +35,17 @@ def load_day_data(date, data_dir="data/"):
     date_str = date.strftime("%Y%m%d")
     filename = os.path.join(data_dir, f"ts_summary_{date_str}.csv")
     
-    if not os.path.exists(filename):
-        return None
-    
     try:
-        df = pd.read_csv(filename)
-        return df
+        # Parquet compacté en priorité, sinon CSV
+        return read_day_table(filename)
     except Exception as e:
         print(f"Erreur lors de la lecture du fichier {filename}: {e}")
         return None
 
 def format_time(time_str):
     """Formate la date au format jj.mm.aaaa hh:mm"""
+    if isinstance(time_str, datetime):
+        return time_str.strftime("%d.%m.%Y %H:%M")
     try:
         dt = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S")
         return dt.strftime("%d.%m.%Y %H:%M")
@@ -8,18 +8,41 @@ import requests
 import pandas as pd
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import argparse
+import glob
+import hashlib
+
+from energie_store import read_day_table
 
 # Configuration par défaut
 DEFAULT_CONFIG = {
     "api_key": "api_key",
     "site_id": "site_id",
     "data_dir": "data/",
-    "days_to_fetch": 7
+    "days_to_fetch": 7,
+    "api_url": "https://monitoringapi.solaredge.com",
+    "max_workers": 3,  # SolarEdge refuse plus de 3 requêtes simultanées
+    "daily_quota": 300,  # requêtes par jour et par site autorisées par SolarEdge
+    "min_interval": 0.2,  # secondes minimum entre deux requêtes
+    "timeout": 30,  # secondes
+    "retries": 4,  # nouvelles tentatives après une erreur temporaire
+    "backoff": 1.0,  # attente avant la première nouvelle tentative, doublée à chaque essai (secondes)
+    "cache": True,  # garder les réponses de l'API dans data_dir/solaredge_cache
+    "cache_ttl": 900  # durée de validité (secondes) d'une réponse qui couvre aujourd'hui
 }
 
 CONFIG_FILE = "solaredge_config.json"
+SYNC_STATE_FILE = "solaredge_sync.json"  # dans data_dir: dernières données complètes récupérées
+SYNC_LAG = timedelta(hours=1)  # les dernières valeurs de puissance sont redemandées à l'exécution suivante
+CACHE_DIR = "solaredge_cache"  # dans data_dir: réponses de l'API
+QUOTA_FILE = "solaredge_quota.json"  # dans data_dir: requêtes faites aujourd'hui, toutes exécutions confondues
+
+# Statuts HTTP temporaires: la requête est retentée
+RETRY_STATUS = (429, 500, 502, 503, 504)
 
 def load_config():
     """Charge la configuration depuis un fichier JSON ou utilise les valeurs par défaut"""
@@ -43,71 +66,331 @@ def load_config():
         print("Veuillez éditer ce fichier avec vos informations SolarEdge avant de continuer")
         return DEFAULT_CONFIG
 
-def get_solaredge_energy_data(api_key, site_id, start_date, end_date):
-    """Récupère les données d'énergie depuis l'API SolarEdge"""
-    base_url = "https://monitoringapi.solaredge.com"
-    
-    # Convertir les dates au format requis (YYYY-MM-DD)
-    start_date_str = start_date.strftime("%Y-%m-%d")
-    end_date_str = end_date.strftime("%Y-%m-%d")
+class ResponseCache:
+    """Réponses de l'API gardées sur disque, un fichier JSON par requête.
+
+    La clé est un hash de l'URL de l'API, de l'endpoint, du site et des
+    paramètres (période), sans la clé API: les périodes demandées sont
+    alignées sur les jours, mois ou années pour que la même requête se
+    répète d'une exécution à l'autre. Une réponse reçue plus de SYNC_LAG
+    après la fin de sa période ne change plus (SolarEdge complète les
+    dernières valeurs avec du retard): elle est gardée sans limite. Les
+    autres ne sont valables que `ttl` secondes.
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def path(self, api_url, site_id, endpoint, params):
+        key = json.dumps([api_url, str(site_id), endpoint, params], sort_keys=True)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    @staticmethod
+    def is_final(params, fetched):
+        """Indique si une réponse reçue à `fetched` (secondes depuis 1970) ne peut plus changer:
+        elle a été reçue plus de SYNC_LAG après la fin de la période demandée"""
+        try:
+            if 'endTime' in params:
+                end = datetime.fromisoformat(params['endTime'])
+            elif 'endDate' in params:
+                end = datetime.fromisoformat(params['endDate']) + timedelta(days=1)
+            else:
+                return False
+        except ValueError:
+            return False
+        return fetched > (end + SYNC_LAG).timestamp()
+
+    def get(self, path, params, allow_stale=False):
+        """Réponse en cache (None si absente ou périmée, sauf `allow_stale`)"""
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+        if not allow_stale and not self.is_final(params, entry['fetched']) \
+                and time.time() - entry['fetched'] > self.ttl:
+            with self.lock:
+                self.stale += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return entry['data']
+
+    def put(self, path, params, data):
+        """Enregistre une réponse (écriture dans un fichier temporaire puis renommage)"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'fetched': time.time(), 'params': params, 'data': data}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du cache {path}: {e}")
+
+    def summary(self):
+        return f"cache: {self.hits} réponses réutilisées, {self.misses} absentes, {self.stale} périmées"
+
+class SolarEdgeClient:
+    """Accès à l'API SolarEdge: session HTTP partagée, quota, délai entre requêtes et nouvelles tentatives.
+
+    La session garde ses connexions ouvertes (une par thread de récupération).
+    Une erreur temporaire (connexion, délai dépassé, 429, 5xx) est retentée
+    après une attente qui double à chaque essai; chaque essai compte dans le
+    quota. Le quota est journalier: le nombre de requêtes du jour est gardé
+    dans QUOTA_FILE et partagé entre les exécutions. La clé API n'apparaît
+    jamais dans les messages.
+
+    Avec `cache`, une réponse déjà reçue est relue sur disque sans requête;
+    avec `offline`, aucune requête n'est faite et seul le cache est utilisé
+    (même périmé).
+    """
+
+    def __init__(self, config, cache=None, offline=False):
+        self.api_url = config['api_url'].rstrip('/')
+        self.api_key = config['api_key']
+        self.site_id = config['site_id']
+        self.timeout = config['timeout']
+        self.retries = config['retries']
+        self.backoff = config['backoff']
+        self.min_interval = config['min_interval']
+        self.max_workers = max(1, config['max_workers'])
+        self.daily_quota = config['daily_quota']
+        self.quota_path = os.path.join(config['data_dir'], QUOTA_FILE)
+        self.quota_day, self.used = self._load_usage()
+        self.requests = 0
+        self.failures = 0  # requêtes abandonnées (erreur ou quota épuisé)
+        self.lock = threading.Lock()
+        self.next_request = 0.0
+        self.cache = cache
+        self.offline = offline
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def redact(self, message):
+        """Retire la clé API d'un message (les exceptions de requests contiennent l'URL)"""
+        return str(message).replace(self.api_key, "***") if self.api_key else str(message)
+
+    def _load_usage(self):
+        """(jour, requêtes faites ce jour-là) lus dans QUOTA_FILE, (aujourd'hui, 0) s'il est absent"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        try:
+            with open(self.quota_path, 'r') as f:
+                usage = json.load(f)
+        except FileNotFoundError:
+            return today, 0
+        except Exception as e:
+            print(f"Erreur lors de la lecture du compteur de requêtes {self.quota_path}: {e}")
+            return today, 0
+        # Un serveur de test (--api-url) ne consomme pas le quota de l'API réelle
+        if usage.get('site_id') != str(self.site_id) or usage.get('api_url') != self.api_url \
+                or usage.get('date') != today:
+            return today, 0
+        return today, int(usage.get('requests', 0))
+
+    def _save_usage(self):
+        """Réécrit atomiquement le nombre de requêtes du jour (appelé sous le verrou)"""
+        try:
+            os.makedirs(os.path.dirname(self.quota_path) or ".", exist_ok=True)
+            with open(self.quota_path + ".tmp", 'w') as f:
+                json.dump({'site_id': str(self.site_id), 'api_url': self.api_url,
+                           'date': self.quota_day, 'requests': self.used}, f)
+            os.replace(self.quota_path + ".tmp", self.quota_path)
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du compteur de requêtes {self.quota_path}: {e}")
+
+    @property
+    def remaining(self):
+        """Requêtes encore autorisées aujourd'hui"""
+        return max(0, self.daily_quota - self.used)
+
+    def _acquire(self):
+        """Réserve une requête dans le quota du jour et respecte le délai minimum; False si le quota est épuisé"""
+        with self.lock:
+            today = datetime.now().strftime("%Y-%m-%d")
+            if today != self.quota_day:
+                self.quota_day, self.used = today, 0
+            if self.used >= self.daily_quota:
+                return False
+            self.used += 1
+            self._save_usage()
+            self.requests += 1
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def get(self, endpoint, params):
+        """Requête GET sur /site/<site_id>/<endpoint>; retourne le JSON décodé ou None après erreur"""
+        data = self._get(endpoint, params)
+        if data is None:
+            with self.lock:
+                self.failures += 1
+        return data
+
+    def _get(self, endpoint, params):
+        description = f"{endpoint} {params.get('startDate', params.get('startTime'))} -> {params.get('endDate', params.get('endTime'))}"
+        cache_path = None
+        if self.cache is not None:
+            cache_path = self.cache.path(self.api_url, self.site_id, endpoint, params)
+            data = self.cache.get(cache_path, params, allow_stale=self.offline)
+            if data is not None:
+                return data
+        if self.offline:
+            print(f"⚠️  Mode hors ligne: {description} absent du cache")
+            return None
+        data = self._request(endpoint, params, description)
+        if data is not None and cache_path is not None:
+            self.cache.put(cache_path, params, data)
+        return data
+
+    def _request(self, endpoint, params, description):
+        url = f"{self.api_url}/site/{self.site_id}/{endpoint}"
+        params = dict(params, api_key=self.api_key)
+        for attempt in range(self.retries + 1):
+            if not self._acquire():
+                print(f"⚠️  Quota journalier de requêtes SolarEdge épuisé ({self.daily_quota}), {description} non récupéré")
+                return None
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = self.redact(e)
+            except requests.exceptions.RequestException as e:
+                print(f"Erreur de l'API SolarEdge ({description}): {self.redact(e)}")
+                return None
+            except ValueError as e:
+                print(f"Réponse invalide de l'API SolarEdge ({description}): {e}")
+                return None
+            if attempt < self.retries:
+                print(f"Erreur temporaire ({description}): {error}, nouvel essai dans {delay:g} s")
+                time.sleep(delay)
+        print(f"Erreur de connexion à l'API SolarEdge ({description}): {error}, abandon après {self.retries + 1} essais")
+        return None
+
+    def fetch_chunks(self, fetch, chunks):
+        """Exécute `fetch(début, fin)` pour chaque intervalle, au plus max_workers à la fois, résultats dans l'ordre"""
+        if len(chunks) == 1:
+            return [fetch(*chunks[0])]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda chunk: fetch(*chunk), chunks))
+
+def split_range(start, end, unit):
+    """Découpe [start, end] en intervalles acceptés par l'API: un par mois ("month") ou par année ("year").
+
+    Retourne une liste de (début, fin) contigus, la fin de chaque intervalle
+    étant la dernière seconde du mois ou de l'année (ou `end`).
+    """
+    chunks = []
+    while start <= end:
+        if unit == "year":
+            boundary = datetime(start.year + 1, 1, 1)
+        else:
+            boundary = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        chunk_end = min(end, boundary - timedelta(seconds=1))
+        chunks.append((start, chunk_end))
+        start = boundary
+    return chunks
+
+def power_ranges(start, end):
+    """Découpe [start, end] en intervalles de requêtes de puissance alignés pour le cache.
+
+    Mois civils entiers avant le mois de `end`, puis un intervalle par jour
+    entier, le dernier se terminant à `end`: une période passée est toujours
+    demandée avec les mêmes paramètres, quel que soit `start`.
+    """
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    month_start = datetime(end.year, end.month, 1)
+    chunks = []
+    if start < month_start:
+        chunks += split_range(datetime(start.year, start.month, 1), month_start - timedelta(seconds=1), "month")
+    day = max(start, month_start)
+    while day <= end:
+        next_day = day + timedelta(days=1)
+        chunks.append((day, min(end, next_day - timedelta(seconds=1))))
+        day = next_day
+    return chunks
+
+def get_solaredge_energy_data(client, start_date, end_date):
+    """Récupère l'énergie produite par jour depuis l'API SolarEdge (une requête par année civile)"""
     
-    # URL de l'API pour les données d'énergie
-    url = f"{base_url}/site/{site_id}/energy?api_key={api_key}&startDate={start_date_str}&endDate={end_date_str}&timeUnit=DAY"
+    def fetch(start, end):
+        # Convertir les dates au format requis (YYYY-MM-DD)
+        data = client.get("energy", {"startDate": start.strftime("%Y-%m-%d"),
+                                     "endDate": end.strftime("%Y-%m-%d"), "timeUnit": "DAY"})
+        if data is None or 'energy' not in data or 'values' not in data['energy']:
+            return None
+        return pd.DataFrame(data['energy']['values'])
     
+    print(f"Récupération de l'énergie quotidienne du {start_date:%d/%m/%Y} au {end_date:%d/%m/%Y}")
     try:
-        print(f"Récupération des données depuis {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if 'energy' not in data or 'values' not in data['energy']:
+        # Années civiles entières (la dernière jusqu'à end_date): mêmes requêtes d'une exécution à l'autre
+        chunks = split_range(datetime(start_date.year, 1, 1), end_date, "year")
+        frames = [df for df in client.fetch_chunks(fetch, chunks)
+                  if df is not None and not df.empty]
+        if not frames:
             print("Aucune donnée disponible pour la période spécifiée")
             return None
-            
+        
         # Convertir en DataFrame pandas
-        df = pd.DataFrame(data['energy']['values'])
+        df = pd.concat(frames, ignore_index=True)
         df['date'] = pd.to_datetime(df['date'])
         
-        # Renommer les colonnes pour plus de clarté
+        # Renommer les colonnes pour plus de clarté (l'API donne l'énergie en Wh)
         df = df.rename(columns={
             'date': 'Date',
-            'value': 'Production_kWh'
+            'value': 'Production_Wh'
         })
+        df['Production_kWh'] = df['Production_Wh'] / 1000
         
-        return df
+        return df[df['Date'] >= start_date.replace(hour=0, minute=0, second=0, microsecond=0)]
         
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur de connexion à l'API SolarEdge: {e}")
-        return None
     except Exception as e:
-        print(f"Erreur lors du traitement des données: {e}")
+        print(f"Erreur lors du traitement des données: {client.redact(e)}")
         return None
 
-def get_solaredge_power_data(api_key, site_id, start_date, end_date):
-    """Récupère les données de puissance en temps réel depuis l'API SolarEdge"""
-    base_url = "https://monitoringapi.solaredge.com"
+def get_solaredge_power_data(client, start_date, end_date):
+    """Récupère la puissance produite (intervalle de 15 minutes) depuis l'API SolarEdge (une requête par mois)"""
     
-    # Convertir les dates au format requis
-    start_date_str = start_date.strftime("%Y-%m-%d %H:%M:%S")
-    end_date_str = end_date.strftime("%Y-%m-%d %H:%M:%S")
-    
-    # URL de l'API pour les données de puissance (15 minutes d'intervalle)
-    url = f"{base_url}/site/{site_id}/power?api_key={api_key}&startTime={start_date_str}&endTime={end_date_str}"
+    def fetch(start, end):
+        # Convertir les dates au format requis
+        data = client.get("power", {"startTime": start.strftime("%Y-%m-%d %H:%M:%S"),
+                                    "endTime": end.strftime("%Y-%m-%d %H:%M:%S")})
+        if data is None or 'power' not in data or 'values' not in data['power']:
+            return None
+        return pd.DataFrame(data['power']['values'])
     
+    print(f"Récupération de la puissance du {start_date:%d/%m/%Y %H:%M} au {end_date:%d/%m/%Y %H:%M}")
     try:
-        print(f"Récupération des données de puissance depuis {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if 'power' not in data or 'values' not in data['power']:
+        frames = [df for df in client.fetch_chunks(fetch, power_ranges(start_date, end_date))
+                  if df is not None and not df.empty]
+        if not frames:
             print("Aucune donnée de puissance disponible")
             return None
-            
+        
         # Convertir en DataFrame pandas
-        df = pd.DataFrame(data['power']['values'])
+        df = pd.concat(frames, ignore_index=True)
         df['date'] = pd.to_datetime(df['date'])
         
         # Renommer les colonnes
@@ -116,34 +399,95 @@ def get_solaredge_power_data(api_key, site_id, start_date, end_date):
             'value': 'Production_W'
         })
         
+        # Valeurs nulles (nuit, onduleur hors ligne) en NaN: la colonne reste numérique
+        # même si tout un intervalle est nul
+        df['Production_W'] = pd.to_numeric(df['Production_W'], errors='coerce')
+        
         # Convertir les watts en kilowatts
         df['Production_kW'] = df['Production_W'] / 1000
         
-        return df
+        # Les intervalles alignés commencent avant start_date: seules les valeurs demandées sont gardées
+        return df[df['Time'] >= start_date]
         
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur de connexion à l'API SolarEdge: {e}")
-        return None
     except Exception as e:
-        print(f"Erreur lors du traitement des données de puissance: {e}")
+        print(f"Erreur lors du traitement des données de puissance: {client.redact(e)}")
         return None
 
 def save_data_to_csv(df, filename, data_dir):
-    """Sauvegarde les données dans un fichier CSV"""
+    """Sauvegarde les données dans un fichier CSV (écriture dans un fichier temporaire puis renommage)"""
     try:
         # Créer le répertoire s'il n'existe pas
         os.makedirs(data_dir, exist_ok=True)
         
         filepath = os.path.join(data_dir, filename)
-        df.to_csv(filepath, index=False)
+        tmp_path = filepath + ".tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, filepath)
+        # Un Parquet compacté du même jour serait lu en priorité: il est périmé
+        parquet_path = os.path.splitext(filepath)[0] + ".parquet"
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
         print(f"Données sauvegardées dans {filepath}")
         return True
     except Exception as e:
         print(f"Erreur lors de la sauvegarde du fichier: {e}")
         return False
 
-def create_daily_summary(df_power, date):
-    """Crée un résumé quotidien des données de puissance"""
+def count_changed_rows(existing, merged, key):
+    """Nombre de lignes de `merged` absentes de `existing` ou dont une valeur a changé.
+
+    Les lignes sont alignées sur la colonne `key`; deux valeurs manquantes
+    (NaN) sont considérées égales.
+    """
+    old = existing.drop_duplicates(subset=key, keep='last').set_index(key)
+    new = merged.set_index(key)
+    common = new.index.intersection(old.index)
+    changed = len(new.index.difference(old.index))
+    differs = pd.Series(False, index=common)
+    for column in new.columns:
+        if column not in old.columns:
+            differs |= new.loc[common, column].notna()
+            continue
+        a = new.loc[common, column]
+        b = old.loc[common, column]
+        differs |= (a != b) & ~(a.isna() & b.isna())
+    return changed + int(differs.sum())
+
+def upsert_day_file(df, filename, data_dir, key):
+    """Fusionne `df` dans le fichier jour `filename`: une ligne par valeur de `key`, la plus récente gagne.
+
+    Retourne le nombre de lignes nouvelles ou modifiées (0: fichier inchangé, non réécrit).
+    """
+    existing = read_day_table(os.path.join(data_dir, filename))
+    if existing is None or existing.empty:
+        merged = df
+        changed = len(df)
+    else:
+        merged = pd.concat([existing, df], ignore_index=True)
+        merged = merged.drop_duplicates(subset=key, keep='last')
+        changed = count_changed_rows(existing, merged, key)
+    if not changed:
+        return 0
+    merged = merged.sort_values(key).reset_index(drop=True)
+    if not save_data_to_csv(merged, filename, data_dir):
+        return 0
+    return changed
+
+def save_power_by_day(df_power, data_dir):
+    """Répartit les puissances par jour dans solaredge_power_AAAAMMJJ.csv; retourne les jours modifiés"""
+    days = []
+    df_power = df_power[['Time', 'Production_W', 'Production_kW']]
+    for day, rows in df_power.groupby(df_power['Time'].dt.normalize()):
+        if upsert_day_file(rows, f"solaredge_power_{day.strftime('%Y%m%d')}.csv", data_dir, 'Time'):
+            days.append(day.to_pydatetime())
+    return days
+
+def create_daily_summary(df_power, date, energy_kwh=None):
+    """Crée un résumé quotidien des données de puissance.
+
+    La production totale est l'énergie du jour donnée par l'API (`energy_kwh`)
+    si elle est connue, sinon l'intégrale des puissances 15 minutes.
+    """
     if df_power is None or df_power.empty:
         return None
     
@@ -154,8 +498,8 @@ def create_daily_summary(df_power, date):
     if daily_data.empty:
         return None
     
-    # Calculer les statistiques quotidiennes
-    production_total = daily_data['Production_kW'].sum()  # Total en kWh
+    # Calculer les statistiques quotidiennes (puissances moyennes sur 15 minutes: énergie = somme / 4)
+    production_total = energy_kwh if energy_kwh is not None else daily_data['Production_kW'].sum() * 0.25
     production_max = daily_data['Production_kW'].max()
     production_mean = daily_data['Production_kW'].mean()
     
@@ -170,6 +514,117 @@ def create_daily_summary(df_power, date):
     
     return summary
 
+def load_sync_state(data_dir, site_id):
+    """État de la synchronisation (dernières données complètes), vide s'il n'existe pas ou concerne un autre site"""
+    path = os.path.join(data_dir, SYNC_STATE_FILE)
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Erreur lors de la lecture de l'état de synchronisation {path}: {e}")
+        return {}
+    if state.get('site_id') != str(site_id):
+        return {}
+    return state
+
+def save_sync_state(data_dir, state):
+    """Réécrit atomiquement l'état de la synchronisation"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, SYNC_STATE_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def import_legacy_files(data_dir):
+    """Répartit par jour les anciens fichiers solaredge_power_<début>_to_<fin>.csv (laissés en place)"""
+    days = set()
+    for path in sorted(glob.glob(os.path.join(data_dir, "solaredge_power_*_to_*.csv"))):
+        try:
+            df = pd.read_csv(path)
+            df['Time'] = pd.to_datetime(df['Time'])
+        except Exception as e:
+            print(f"Erreur lors de la lecture de {path}: {e}")
+            continue
+        days.update(save_power_by_day(df, data_dir))
+        print(f"Fichier importé: {os.path.basename(path)}")
+    return days
+
+def sync(client, config, full=False):
+    """Récupère seulement les données postérieures à la dernière synchronisation complète.
+
+    Les puissances sont fusionnées dans un fichier par jour, l'énergie du jour
+    dans le résumé solaredge_daily_AAAAMMJJ.csv des jours modifiés. L'état est
+    enregistré dans SYNC_STATE_FILE: la prochaine exécution reprend à la
+    dernière donnée complète (heure de fin moins SYNC_LAG, les dernières
+    valeurs pouvant encore arriver).
+    """
+    data_dir = config['data_dir']
+    state = {} if full else load_sync_state(data_dir, config['site_id'])
+    failures = client.failures
+    # Fin des requêtes sur la grille de 15 minutes des puissances: une même requête
+    # répétée dans le quart d'heure est servie par le cache
+    now = datetime.now().replace(second=0, microsecond=0)
+    now = now.replace(minute=now.minute // 15 * 15)
+    days = set()
+    if not state:
+        days.update(import_legacy_files(data_dir))
+        start = (now - timedelta(days=config['days_to_fetch'])).replace(hour=0, minute=0, second=0)
+        power_start = energy_start = start
+        print(f"🌞 Synchronisation complète des {config['days_to_fetch']} derniers jours")
+    else:
+        power_start = datetime.fromisoformat(state['power_complete'])
+        energy_start = datetime.fromisoformat(state['energy_complete']) + timedelta(days=1)
+        print(f"🌞 Synchronisation depuis le {power_start:%d/%m/%Y %H:%M}")
+    
+    # Puissances (15 minutes): seulement l'intervalle manquant
+    print("\n⚡ Récupération des données de puissance détaillées...")
+    power_data = get_solaredge_power_data(client, power_start, now)
+    power_ok = client.failures == failures
+    power_days = set()
+    if power_data is not None:
+        power_days.update(save_power_by_day(power_data, data_dir))
+    days.update(power_days)
+    
+    # Énergie par jour: les jours terminés ne sont plus redemandés
+    print("\n📊 Récupération des données d'énergie quotidienne...")
+    energy_start = min(energy_start, now.replace(hour=0, minute=0, second=0))
+    failures = client.failures
+    energy_data = get_solaredge_energy_data(client, energy_start, now)
+    energy_ok = client.failures == failures
+    energy = {}
+    if energy_data is not None:
+        energy = {row.Date.strftime("%Y%m%d"): row.Production_kWh
+                  for row in energy_data.itertuples() if pd.notna(row.Production_kWh)}
+        days.update(datetime.strptime(day, "%Y%m%d") for day in energy)
+    
+    # Résumés des jours modifiés
+    if days:
+        print("\n📈 Création des résumés quotidiens...")
+    updated = set()
+    for day in sorted(days):
+        date_str = day.strftime("%Y%m%d")
+        df_power = read_day_table(os.path.join(data_dir, f"solaredge_power_{date_str}.csv"))
+        daily_summary = create_daily_summary(df_power, day, energy.get(date_str))
+        if daily_summary is None:
+            continue
+        daily_summary['Date'] = pd.to_datetime(daily_summary['Date'])
+        if upsert_day_file(daily_summary, f"solaredge_daily_{date_str}.csv", data_dir, 'Date') or day in power_days:
+            updated.add(day)
+    
+    # Avancer l'état seulement si tous les intervalles ont été récupérés
+    # (sinon tout est redemandé à l'exécution suivante: la fusion évite les doublons)
+    if power_ok:
+        complete = now - SYNC_LAG
+        state['power_complete'] = complete.replace(minute=complete.minute // 15 * 15, second=0).isoformat()
+    if energy_ok:
+        state['energy_complete'] = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+    if 'power_complete' in state and 'energy_complete' in state:
+        state['site_id'] = str(config['site_id'])
+        save_sync_state(data_dir, state)
+    return sorted(updated)
+
 def main():
     """Fonction principale"""
     # Charger la configuration
@@ -183,55 +638,45 @@ def main():
     # Parser les arguments de ligne de commande
     parser = argparse.ArgumentParser(description='Récupère les données SolarEdge')
     parser.add_argument('--days', type=int, default=config['days_to_fetch'], 
-                       help='Nombre de jours de données à récupérer')
+                       help='Nombre de jours de données à récupérer lors de la première synchronisation (ou avec --full)')
+    parser.add_argument('--full', action='store_true',
+                       help=f'Ignore l\'état de synchronisation ({SYNC_STATE_FILE}) et récupère les --days derniers jours')
     parser.add_argument('--output', type=str, default=config['data_dir'], 
                        help='Répertoire de sortie pour les fichiers CSV')
+    parser.add_argument('--api-url', type=str, default=config['api_url'],
+                       help=f"URL de l'API (défaut: {config['api_url']}), par exemple un serveur de test local")
+    parser.add_argument('--workers', type=int, default=config['max_workers'],
+                       help=f"Requêtes simultanées au maximum (défaut: {config['max_workers']})")
+    parser.add_argument('--quota', type=int, default=config['daily_quota'],
+                       help=f"Nombre maximum de requêtes par jour, toutes exécutions confondues ({QUOTA_FILE}, défaut: {config['daily_quota']})")
+    parser.add_argument('--offline', action='store_true',
+                       help=f"N'interroge pas l'API: utilise seulement les réponses en cache ({CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true',
+                       help="Ni lecture ni écriture du cache des réponses")
     
     args = parser.parse_args()
     
     # Mettre à jour la configuration avec les arguments
     config['days_to_fetch'] = args.days
     config['data_dir'] = args.output
+    config['api_url'] = args.api_url
+    config['max_workers'] = args.workers
+    config['daily_quota'] = args.quota
+    cache = None
+    if config['cache'] and not args.no_cache:
+        cache = ResponseCache(os.path.join(config['data_dir'], CACHE_DIR), config['cache_ttl'])
+    if args.offline and cache is None:
+        print("❌ Le mode hors ligne nécessite le cache des réponses")
+        return
+    client = SolarEdgeClient(config, cache, args.offline)
     
-    print(f"🌞 Récupération des données SolarEdge pour les {config['days_to_fetch']} derniers jours")
-    
-    # Calculer les dates
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=config['days_to_fetch'])
-    
-    # Récupérer les données d'énergie (quotidienne)
-    print("\n📊 Récupération des données d'énergie quotidienne...")
-    energy_data = get_solaredge_energy_data(config['api_key'], config['site_id'], start_date, end_date)
-    
-    if energy_data is not None:
-        # Sauvegarder les données d'énergie
-        energy_filename = f"solaredge_energy_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv"
-        save_data_to_csv(energy_data, energy_filename, config['data_dir'])
+    days = sync(client, config, args.full)
     
-    # Récupérer les données de puissance (détaillées)
-    print("\n⚡ Récupération des données de puissance détaillées...")
-    power_data = get_solaredge_power_data(config['api_key'], config['site_id'], start_date, end_date)
-    
-    if power_data is not None:
-        # Sauvegarder les données de puissance complètes
-        power_filename = f"solaredge_power_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv"
-        save_data_to_csv(power_data, power_filename, config['data_dir'])
-        
-        # Créer des résumés quotidiens
-        print("\n📈 Création des résumés quotidiens...")
-        current_date = start_date
-        
-        while current_date <= end_date:
-            daily_summary = create_daily_summary(power_data, current_date)
-            
-            if daily_summary is not None:
-                date_str = current_date.strftime("%Y%m%d")
-                summary_filename = f"solaredge_daily_{date_str}.csv"
-                save_data_to_csv(daily_summary, summary_filename, config['data_dir'])
-            
-            current_date += timedelta(days=1)
-    
-    print("\n✅ Opération terminée!")
+    client.close()
+    print(f"\n✅ Opération terminée! ({client.requests} requêtes à l'API, {client.remaining} encore autorisées aujourd'hui, "
+          f"{len(days)} jours mis à jour)")
+    if cache is not None:
+        print(f"💾 {cache.summary()}")
     print(f"Les données ont été sauvegardées dans le répertoire: {os.path.abspath(config['data_dir'])}")
 
 if __name__ == "__main__":
@@ -19,8 +19,10 @@ LOG_FILE="/home/yogi/appl.energie/sync_log.txt"
 # Options rsync
 RSYNC_OPTS="-avz --progress --partial --delete"
 
-# Filtre pour les fichiers CSV uniquement
-RSYNC_FILTER="--include='*.csv' --exclude='*'"
+# Filtre pour les fichiers CSV, les fichiers binaires jour et les Parquet compactés
+# (compact_parquet.py tourne sur le Pi), y compris dans les sous-répertoires des
+# compteurs secondaires (sans le spool)
+RSYNC_FILTER="--exclude='.spool/' --include='*/' --include='*.csv' --include='*.bin' --include='*.parquet' --exclude='*'"
 
 # Chemin vers la clé SSH spécifique pour cron
 SSH_KEY="/home/yogi/.ssh/id_rsa_cron"
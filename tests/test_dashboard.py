@@ -0,0 +1,76 @@
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+import dashboard
+from energie_schema import FIELDS, ROLLUP_HEADERS, TS_HEADERS
+
+
+def write_csv(path, headers, rows):
+    with open(path, "w") as file:
+        file.write(",".join(headers) + "\n")
+        for row in rows:
+            file.write(",".join(str(value) for value in row) + "\n")
+
+
+def ts_row(time, e1):
+    values = {name: "" for name in FIELDS}
+    values.update(Pi=500, Po=0, E1=e1, E2=100)
+    return [time, "260114000000W", 1] + [values[name] for name in FIELDS]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    data_dir = str(tmp_path) + os.sep
+    write_csv(tmp_path / "ts_summary_20260114.csv", TS_HEADERS,
+              [ts_row("2026-01-14 10:00:00", 1000), ts_row("2026-01-14 10:05:00", 1001)])
+    monkeypatch.setattr(dashboard, "DATA_DIR", data_dir)
+    monkeypatch.setattr(dashboard, "daily_store", None)
+    monkeypatch.setattr(dashboard, "date_index", dashboard.DateIndex())
+    dashboard.page_cache.clear()
+    dashboard.api_cache.clear()
+    yield dashboard.app.test_client()
+    if dashboard.daily_store is not None:
+        dashboard.daily_store.close()
+
+
+def test_page_etag_changes_with_summary_sources(client, tmp_path):
+    first = client.get("/date/2026-01-14")
+    assert first.status_code == 200
+    etag = first.headers["ETag"].strip('"')
+    assert client.get("/date/2026-01-14", headers={"If-None-Match": etag}).status_code == 304
+
+    # Seul le rollup 1h (source des index E1/E2 du bilan) change
+    row = {name: "" for name in ROLLUP_HEADERS}
+    row.update(Time="2026-01-14 10:00:00", E1_first=1000, E1_last=1005, count=3600)
+    write_csv(tmp_path / "rollup_1h_20260114.csv", ROLLUP_HEADERS, [[row[name] for name in ROLLUP_HEADERS]])
+
+    second = client.get("/date/2026-01-14", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.headers["ETag"].strip('"') != etag
+
+
+def test_api_rejects_non_numeric_fields(client):
+    response = client.get("/api/day/2026-01-14?res=ts&fields=TS")
+    assert response.status_code == 400
+    assert "TS" in response.get_json()["error"]
+    assert client.get("/api/day/2026-01-14?res=ts&fields=Pi,Nope").status_code == 400
+    assert client.get("/api/live?fields=Time").status_code == 400
+    response = client.get("/api/day/2026-01-14?res=ts&fields=Pi,E1")
+    assert response.status_code == 200
+    assert response.get_json()["fields"]["E1"] == [1000, 1001]
+
+
+def test_summary_update_keeps_date_index(client, tmp_path):
+    store = dashboard.get_daily_store()
+    dates = dashboard.date_index.refresh()
+    assert dates == [datetime(2026, 1, 14)]
+    mtime = os.stat(tmp_path).st_mtime_ns
+    time.sleep(0.05)  # laisser passer la granularité des dates de modification
+
+    assert store.update(datetime(2026, 1, 14), dashboard.DATA_DIR, force=True)
+    assert os.stat(tmp_path).st_mtime_ns == mtime
+    # Liste non reconstruite: l'index garde la même liste
+    assert dashboard.date_index.refresh() is dates
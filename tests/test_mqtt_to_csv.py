@@ -0,0 +1,22 @@
+import time
+
+import mqttToCsv
+
+
+def read_rows(path):
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+def test_flush_interval_shorter_than_periodic_tick(tmp_path):
+    path = tmp_path / "energie_20260114.csv"
+    writer = mqttToCsv.CsvDayWriter(str(path), ["Time", "Pi"], flush_rows=1000, flush_interval=0.05, fsync=False)
+    try:
+        writer.writerow(["2026-01-14 10:00:00", 1.0])
+        assert read_rows(path) == []  # encore dans le tampon
+        time.sleep(0.06)
+        writer.writerows([["2026-01-14 10:00:01", 2.0]])
+        # Sans attendre periodic_write (toutes les 60 s), l'intervalle dépassé déclenche le flush
+        assert read_rows(path) == ["Time,Pi", "2026-01-14 10:00:00,1.0", "2026-01-14 10:00:01,2.0"]
+    finally:
+        writer.close()